@@ -27,6 +27,16 @@ class Buffer(object):
 
         self.step = 0
 
+    def state_dict(self):
+        keys = ["obs", "act", "val", "rew", "ret", "logp", "masks", "timeout"]
+        state = {key: getattr(self, key) for key in keys}
+        state["step"] = self.step
+        return state
+
+    def load_state_dict(self, state):
+        for key, value in state.items():
+            setattr(self, key, value)
+
     def insert(self, obs, act, logp, val, rew, masks, timeouts):
         if isinstance(obs, dict):
             for obs_type, obs_val in obs.items():
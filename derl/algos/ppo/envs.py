@@ -11,6 +11,8 @@ from derl.envs.vec_env.dummy_vec_env import DummyVecEnv
 from derl.envs.vec_env.pytorch_vec_env import VecPyTorch
 from derl.envs.vec_env.subproc_vec_env import SubprocVecEnv
 from derl.envs.vec_env.vec_normalize import VecNormalize
+from derl.envs.wrappers.compiled import CompiledEnv
+from derl.envs.wrappers.compiled import PostStepWrapper
 
 
 def make_env(env_id, seed, rank, xml_file=None):
@@ -27,6 +29,8 @@ def make_env(env_id, seed, rank, xml_file=None):
             env = TimeLimitMask(env)
         # Store the un-normalized rewards
         env = RecordEpisodeStatistics(env)
+        if cfg.ENV.COMPILE_WRAPPERS:
+            env = CompiledEnv(env)
         return env
 
     return _thunk
@@ -59,7 +63,12 @@ def make_vec_envs(
     elif cfg.VECENV.TYPE == "DummyVecEnv":
         envs = DummyVecEnv(envs)
     elif cfg.VECENV.TYPE == "SubprocVecEnv":
-        envs = SubprocVecEnv(envs, in_series=cfg.VECENV.IN_SERIES, context="fork")
+        envs = SubprocVecEnv(
+            envs,
+            in_series=cfg.VECENV.IN_SERIES,
+            context="fork",
+            batch_sims=cfg.VECENV.BATCH_SIMS,
+        )
     else:
         raise ValueError("VECENV: {} is not supported.".format(cfg.VECENV.TYPE))
 
@@ -101,9 +110,8 @@ def set_ob_rms(venv, ob_rms):
 
 
 # Checks whether done was caused my timit limits or not
-class TimeLimitMask(gym.Wrapper):
-    def step(self, action):
-        obs, rew, done, info = self.env.step(action)
+class TimeLimitMask(PostStepWrapper):
+    def post_step(self, obs, rew, done, info):
         if done and self.env._max_episode_steps == self.env._elapsed_steps:
             info["timeout"] = True
 
@@ -113,7 +121,7 @@ class TimeLimitMask(gym.Wrapper):
         return self.env.reset(**kwargs)
 
 
-class RecordEpisodeStatistics(gym.Wrapper):
+class RecordEpisodeStatistics(PostStepWrapper):
     def __init__(self, env, deque_size=100):
         super(RecordEpisodeStatistics, self).__init__(env)
         self.t0 = (
@@ -133,10 +141,7 @@ class RecordEpisodeStatistics(gym.Wrapper):
         self.episode_length = 0
         return observation
 
-    def step(self, action):
-        observation, reward, done, info = super(
-            RecordEpisodeStatistics, self
-        ).step(action)
+    def post_step(self, observation, reward, done, info):
         self.episode_return += reward
         self.episode_length += 1
         for key, value in info.items():
@@ -64,9 +64,9 @@ class Agent:
         self.ac = actor_critic
 
     @torch.no_grad()
-    def act(self, obs):
+    def act(self, obs, deterministic=False):
         val, pi, _, _ = self.ac(obs)
-        act = pi.sample()
+        act = pi.loc if deterministic else pi.sample()
         logp = pi.log_prob(act).sum(-1, keepdim=True)
         return val, act, logp
 
@@ -1,4 +1,5 @@
 import os
+import random
 import time
 from collections import defaultdict
 from collections import deque
@@ -15,6 +16,7 @@ from derl.utils import file as fu
 
 from .buffer import Buffer
 from .envs import get_ob_rms
+from .envs import get_vec_normalize
 from .envs import make_vec_envs
 from .envs import set_ob_rms
 from .model import ActorCritic
@@ -60,15 +62,25 @@ class PPO:
 
         self.fps = 0
 
-    def train(self, exit_cond=None):
+    def train(self, exit_cond=None, checkpoint_path=None):
         obs = self.envs.reset()
         ep_rew = defaultdict(lambda: deque(maxlen=10))
         ep_pos = deque(maxlen=10)
         ep_vel = deque(maxlen=10)
         ep_metric = deque(maxlen=10)
+        ep_stats = {
+            "rew": ep_rew, "pos": ep_pos, "vel": ep_vel, "metric": ep_metric
+        }
         self.start = time.time()
 
-        for cur_iter in range(cfg.PPO.MAX_ITERS):
+        start_iter = 0
+        if checkpoint_path and os.path.isfile(checkpoint_path):
+            start_iter = self.load_checkpoint(checkpoint_path, ep_stats)
+            print(
+                "Resuming {} from iter {}".format(self.file_prefix, start_iter)
+            )
+
+        for cur_iter in range(start_iter, cfg.PPO.MAX_ITERS):
 
             if cfg.PPO.LINEAR_LR_DECAY:
                 # Decrease learning rate linearly
@@ -132,6 +144,13 @@ class PPO:
             if len(ep_metric) > 1:
                 self.mean_metric.append(round(np.mean(ep_metric), 2))
 
+            if (
+                checkpoint_path
+                and cfg.CHECKPOINT_PERIOD > 0
+                and (cur_iter + 1) % cfg.CHECKPOINT_PERIOD == 0
+            ):
+                self.save_checkpoint(checkpoint_path, cur_iter + 1, ep_stats)
+
             if (
                 exit_cond == "population_init" and
                 eu.get_population_size() >= cfg.EVO.INIT_POPULATION_SIZE
@@ -194,7 +213,81 @@ class PPO:
     def save_model(self, path=None):
         if not path:
             path = os.path.join(cfg.OUT_DIR, self.file_prefix + ".pt")
-        torch.save([self.actor_critic, get_ob_rms(self.envs)], path)
+        # Save state_dict instead of the pickled module, see load_model
+        with fu.atomic_open(path, "wb") as f:
+            torch.save(
+                {
+                    "model": self.actor_critic.state_dict(),
+                    "ob_rms": get_ob_rms(self.envs),
+                },
+                f,
+            )
+
+    def save_checkpoint(self, path, next_iter, ep_stats):
+        """Save everything needed to resume training from next_iter."""
+        vec_norm = get_vec_normalize(self.envs)
+        rng_state = {
+            "random": random.getstate(),
+            "numpy": np.random.get_state(),
+            "torch": torch.get_rng_state(),
+        }
+        if torch.cuda.is_available():
+            rng_state["cuda"] = torch.cuda.get_rng_state_all()
+
+        state = {
+            "iter": next_iter,
+            "model": self.actor_critic.state_dict(),
+            "optimizer": self.optimizer.state_dict(),
+            "buffer": self.buffer.state_dict(),
+            "ob_rms": vec_norm.ob_rms,
+            "ret_rms": vec_norm.ret_rms,
+            "ret": vec_norm.ret,
+            "rng_state": rng_state,
+            "ep_stats": {
+                "rew": {k: list(v) for k, v in ep_stats["rew"].items()},
+                "pos": list(ep_stats["pos"]),
+                "vel": list(ep_stats["vel"]),
+                "metric": list(ep_stats["metric"]),
+            },
+            "mean_ep_rews": dict(self.mean_ep_rews),
+            "mean_pos": self.mean_pos,
+            "mean_vel": self.mean_vel,
+            "mean_metric": self.mean_metric,
+            "elapsed": time.time() - self.start,
+        }
+        with fu.atomic_open(path, "wb") as f:
+            torch.save(state, f)
+
+    def load_checkpoint(self, path, ep_stats):
+        """Restore state saved by save_checkpoint, returns iter to resume from."""
+        state = torch.load(path, map_location=self.device)
+        self.actor_critic.load_state_dict(state["model"])
+        self.optimizer.load_state_dict(state["optimizer"])
+        self.buffer.load_state_dict(state["buffer"])
+
+        vec_norm = get_vec_normalize(self.envs)
+        vec_norm.ob_rms = state["ob_rms"]
+        vec_norm.ret_rms = state["ret_rms"]
+        vec_norm.ret = state["ret"]
+
+        rng_state = state["rng_state"]
+        random.setstate(rng_state["random"])
+        np.random.set_state(rng_state["numpy"])
+        torch.set_rng_state(rng_state["torch"])
+        if "cuda" in rng_state and torch.cuda.is_available():
+            torch.cuda.set_rng_state_all(rng_state["cuda"])
+
+        for rew_type, rews in state["ep_stats"]["rew"].items():
+            ep_stats["rew"][rew_type].extend(rews)
+        for key in ["pos", "vel", "metric"]:
+            ep_stats[key].extend(state["ep_stats"][key])
+
+        self.mean_ep_rews.update(state["mean_ep_rews"])
+        self.mean_pos = state["mean_pos"]
+        self.mean_vel = state["mean_vel"]
+        self.mean_metric = state["mean_metric"]
+        self.start -= state["elapsed"]
+        return state["iter"]
 
     def _log_stats(self, cur_iter, ep_rew, ep_metric):
         self._log_fps(cur_iter)
@@ -228,15 +321,17 @@ class PPO:
             file_name = "{}_results.json".format(self.file_prefix)
             path = os.path.join(cfg.OUT_DIR, file_name)
 
+        fu.save_json(self.reward_stats(), path)
+
+    def reward_stats(self):
         self._log_fps(cfg.PPO.MAX_ITERS - 1, log=False)
-        stats = {
+        return {
             "rewards": self.mean_ep_rews,
             "fps": self.fps,
             "pos": self.mean_pos,
             "vel": self.mean_vel,
             "metric": self.mean_metric
         }
-        fu.save_json(stats, path)
 
     def save_video(self, save_dir):
         env = make_vec_envs(
@@ -267,6 +362,19 @@ class PPO:
         )
 
 
+def load_model(path, obs_space, action_space, device="cpu"):
+    """Load model saved by PPO.save_model, returns actor_critic and ob_rms."""
+    state = torch.load(path, map_location=device)
+    # Models saved before state_dicts were used: [actor_critic, ob_rms]
+    if isinstance(state, (list, tuple)):
+        actor_critic, ob_rms = state
+        state = {"model": actor_critic.state_dict(), "ob_rms": ob_rms}
+    actor_critic = ActorCritic(obs_space, action_space)
+    actor_critic.load_state_dict(state["model"])
+    actor_critic.to(device)
+    return actor_critic, state["ob_rms"]
+
+
 def lr_linear_decay(optimizer, iter, total_iters, initial_lr):
     """Decreases the learning rate linearly."""
     lr = initial_lr - (initial_lr * (iter / float(total_iters)))
@@ -31,6 +31,38 @@ _C.XML.FILTER_PARENT = "enable"
 
 _C.XML.SHADOWCLIP = 0.5
 
+# Physics fidelity preset, one of FIDELITY_PRESETS. Lower fidelity is useful
+# for early screening of unimals.
+_C.XML.FIDELITY = "default"
+
+# Solver params of each fidelity preset. All presets keep the control step
+# (timestep * frame_skip) at 0.02s, so rewards are comparable across presets.
+# condim None keeps XML.GEOM_CONDIM. "default" matches the template xml and
+# mujoco defaults.
+FIDELITY_PRESETS = {
+    "fast_screening": {
+        "timestep": 0.01,
+        "frame_skip": 2,
+        "iterations": 20,
+        "tolerance": 1e-6,
+        "condim": None,
+    },
+    "default": {
+        "timestep": 0.005,
+        "frame_skip": 4,
+        "iterations": 100,
+        "tolerance": 1e-8,
+        "condim": None,
+    },
+    "accurate": {
+        "timestep": 0.0025,
+        "frame_skip": 8,
+        "iterations": 200,
+        "tolerance": 1e-10,
+        "condim": 4,
+    },
+}
+
 # ----------------------------------------------------------------------------#
 # Body Options
 # ----------------------------------------------------------------------------#
@@ -164,6 +196,10 @@ _C.ENV.GRAVITY = None# Optional wrappers to add to task. Most wrappers for a tas
 # hardcoded in make_env_task func. Put wrappers which you want to experiment
 # with.
 _C.ENV.WRAPPERS = []
+
+# Step through a flattened wrapper stack (see CompiledEnv). Output is identical
+# to the nested wrappers, only the per step call overhead is lower.
+_C.ENV.COMPILE_WRAPPERS = False
 # ----------------------------------------------------------------------------#
 # Terrain Options
 # ----------------------------------------------------------------------------#
@@ -402,6 +438,10 @@ _C.VECENV.TYPE = "SubprocVecEnv"
 # Number of envs to run in series for SubprocVecEnv
 _C.VECENV.IN_SERIES = 4
 
+# Step the sims of the IN_SERIES envs of a process together in native threads
+# (mujoco_py MjSimPool) instead of one after another.
+_C.VECENV.BATCH_SIMS = False
+
 # --------------------------------------------------------------------------- #
 # Evolution Options
 # --------------------------------------------------------------------------- #
@@ -459,6 +499,16 @@ _C.EVO.SELECTION_CRITERIA = ["__reward__forward", "__reward__stand"]
 # minimize.
 _C.EVO.SELECTION_CRITERIA_OBJ = [-1, -1]
 
+# Format of reward histories of trained unimals. "json": one rewards/*.json
+# per unimal. "columnar": appended to the per run store read with
+# fu.load_reward_history.
+_C.EVO.REWARDS_FORMAT = "json"
+
+# Store xml in the content addressed blob store (refer fu.save_bytes),
+# identical xml are stored only once. Linked xml share the mtime of the
+# first identical xml, which changes the time sorted init population.
+_C.EVO.BLOB_STORE = False
+
 # --------------------------------------------------------------------------- #
 # CUDNN options
 # --------------------------------------------------------------------------- #
@@ -509,6 +559,11 @@ _C.NUM_NODES = 1
 _C.UNIMAL_TEMPLATE = "./derl/envs/assets/unimal.xml"
 
 
+def fidelity_preset():
+    """Returns the solver params of the selected fidelity preset."""
+    return FIDELITY_PRESETS[cfg.XML.FIDELITY]
+
+
 def dump_cfg():
     """Dumps the config to the output directory."""
     cfg_file = os.path.join(_C.OUT_DIR, _C.CFG_DEST)
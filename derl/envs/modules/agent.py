@@ -1,5 +1,4 @@
 import numpy as np
-from lxml import etree
 
 import derl.utils.camera as cu
 import derl.utils.xml as xu
@@ -56,23 +55,50 @@ class Agent:
         self.agent_qpos_idxs = np.array(mu.qpos_idxs_for_agent(sim))
         self.agent_qvel_idxs = np.array(mu.qvel_idxs_for_agent(sim))
 
-        site_prefixes = ["limb/btm/", "limb/mid/", "torso"]
         env.metadata["agent_sites"] = mu.names_from_prefixes(
-            sim, site_prefixes, "site"
+            sim, mu.AGENT_SITE_PREFIXES, "site"
         )
 
         self.limb_btm_sites = [
             site for site in env.metadata["agent_sites"] if "limb/btm" in site
         ]
 
-    def observation_step(self, env, sim):
-        observations = []
+        self._compile_observation(env, sim)
+
+    def _compile_observation(self, env, sim):
+        """Resolve ids and output slices of proprioceptive obs once per sim."""
+        self.handles = env.handles
+        self.limb_btm_site_ids = np.array(
+            [self.handles.id("site", site) for site in self.limb_btm_sites],
+            dtype=int,
+        )
+
+        self.obs_qpos_idxs = self.agent_qpos_idxs
+        # Ignores horizontal position to maintain translational invariance
+        if cfg.ENV.SKIP_SELF_POS:
+            if cfg.HFIELD.DIM == 1:
+                self.obs_qpos_idxs = self.obs_qpos_idxs[1:]
+            else:
+                # Skip the 7 DoFs of the free root joint
+                self.obs_qpos_idxs = self.obs_qpos_idxs[7:]
+
+        # List of (obs func, slice in output buffer) in cfg.ENV.OBS_TYPES order
+        self.obs_funcs = []
+        start = 0
         for obs_type in cfg.ENV.OBS_TYPES:
             func = getattr(self, obs_type)
-            observations.append(func(sim))
+            end = start + func(sim).size
+            self.obs_funcs.append((func, slice(start, end)))
+            start = end
+        self.obs_buf = np.zeros(start)
+
+    def observation_step(self, env, sim):
+        for func, obs_slice in self.obs_funcs:
+            self.obs_buf[obs_slice] = func(sim)
 
+        # Copy as obs are stored by vec envs and wrappers across steps
         return {
-            "proprioceptive": np.concatenate(observations).ravel(),
+            "proprioceptive": self.obs_buf.copy(),
         }
 
     def _add_fixed_cameras(self, worldbody):
@@ -112,22 +138,11 @@ class Agent:
     # Proprioceptive observations
     ###########################################################################
     def position(self, sim):
-        pos = sim.data.qpos.flat.copy()
-        pos = pos[self.agent_qpos_idxs]
-
-        if not cfg.ENV.SKIP_SELF_POS:
-            return pos
-        # Ignores horizontal position to maintain translational invariance
-        if cfg.HFIELD.DIM == 1:
-            pos = pos[1:]
-        else:
-            # Skip the 7 DoFs of the free root joint
-            pos = pos[7:]
-        return pos
+        # See _compile_observation for skipped root DoFs
+        return sim.data.qpos[self.obs_qpos_idxs]
 
     def velocity(self, sim):
-        vel = sim.data.qvel.flat.copy()
-        return vel[self.agent_qvel_idxs]
+        return sim.data.qvel[self.agent_qvel_idxs]
 
     def imu_vel(self, sim):
         # Return torso acceleration, torso gyroscope and torso velocity
@@ -139,21 +154,18 @@ class Agent:
 
     def extremities(self, sim):
         """Returns limb positions in torso/0 frame."""
-        torso_frame = sim.data.get_body_xmat("torso/0").reshape(3, 3)
-        torso_pos = sim.data.get_body_xpos("torso/0")
-        positions = []
-        for site_name in self.limb_btm_sites:
-            torso_to_limb = sim.data.get_site_xpos(site_name) - torso_pos
-            positions.append(torso_to_limb.dot(torso_frame)[:2])
-        extremities = np.hstack(positions)
+        torso_frame = self.handles.torso_xmat
+        torso_pos = self.handles.torso_xpos
+        torso_to_limb = sim.data.site_xpos[self.limb_btm_site_ids] - torso_pos
+        return torso_to_limb.dot(torso_frame)[:, :2].ravel()
 
-        return extremities
 
+def merge_agent_with_base(root_a):
+    """Merge agent (or unimal) xml root into a copy of the base template.
 
-def merge_agent_with_base(agent, ispath=True):
-    base_xml = cfg.UNIMAL_TEMPLATE
-    root_b, tree_b = xu.etree_from_xml(base_xml)
-    root_a, tree_a = xu.etree_from_xml(agent, ispath=ispath)
+    Elems of root_a are moved, not copied, into the returned root.
+    """
+    root_b, tree_b = xu.etree_from_cached_xml(cfg.UNIMAL_TEMPLATE)
 
     worldbody = root_b.findall("./worldbody")[0]
     agent_body = xu.find_elem(root_a, "body", "name", "torso/0")[0]
@@ -172,17 +184,4 @@ def merge_agent_with_base(agent, ispath=True):
     sensor_a = root_a.findall("./sensor")[0]
     sensor_b = root_b.findall("./sensor")[0]
     sensor_b.extend(list(sensor_a))
-    return xu.etree_to_str(root_b)
-
-
-def extract_agent_from_xml(xml_path):
-    root, tree = xu.etree_from_xml(xml_path)
-    agent = etree.Element("agent", {"model": "unimal"})
-    unimal = xu.find_elem(root, "body", "name", "torso/0")[0]
-    actuator = root.findall("./actuator")[0]
-    sensor = root.findall("./sensor")[0]
-    agent.append(unimal)
-    agent.append(actuator)
-    agent.append(sensor)
-    agent = xu.etree_to_str(agent)
-    return agent
+    return root_b
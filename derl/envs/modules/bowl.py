@@ -73,9 +73,7 @@ class Bowl:
         sim.model.hfield_data[0 : self.asset_hfield.size] = self.asset_hfield.ravel()
 
     def observation_step(self, env, sim):
-        x_pos, y_pos, _ = sim.data.get_body_xpos("torso/0")
-        row_idx, col_idx = self.pos_to_idx([x_pos, y_pos])
-        return {"hfield_idx": np.asarray([row_idx, col_idx])}
+        return {"hfield_idx": env.terrain_ctx["hfield_idx"]}
 
     def pos_to_idx(self, pos):
         x_pos, y_pos = pos
@@ -23,6 +23,8 @@ class Objects:
                 self.len * cfg.HFIELD.NUM_DIVS * 2,
             )
         )
+        # Summed area table of placement_grid, None when stale
+        self.placement_sat = None
 
         self.obj_pos = None
         self.goal_pos = None
@@ -242,8 +244,8 @@ class Objects:
         obj_rot_vel = vel[self.obj_qvel_idxs][3:]
 
         # Convert obj pos, vel and rot_vel in torso frame
-        torso_frame = sim.data.get_body_xmat("torso/0").reshape(3, 3)
-        torso_pos = sim.data.get_body_xpos("torso/0")
+        torso_frame = env.handles.torso_xmat
+        torso_pos = env.handles.torso_xpos
         agent_qvel_idxs = env.modules["Agent"].agent_qvel_idxs
         agent_vel = vel[agent_qvel_idxs][:3]
 
@@ -259,15 +261,15 @@ class Objects:
 
     def point_nav_obs_step(self, env, sim):
         # Convert box pos, vel and rot_vel in torso frame
-        torso_frame = sim.data.get_body_xmat("torso/0").reshape(3, 3)
-        torso_pos = sim.data.get_body_xpos("torso/0")
+        torso_frame = env.handles.torso_xmat
+        torso_pos = env.handles.torso_xpos
 
         goal_rel_pos = self.goal_pos - torso_pos
         goal_state = goal_rel_pos.dot(torso_frame).ravel()
         return {"goal": goal_state}
 
     def exploration_obs_step(self, env, sim):
-        x_pos, y_pos, _ = sim.data.get_body_xpos("torso/0")
+        x_pos, y_pos, _ = env.handles.torso_xpos
         row_idx, col_idx = self.pos_to_grid_idx([x_pos, y_pos])
         return {"placement_idx": np.asarray([row_idx, col_idx])}
 
@@ -47,8 +47,8 @@ class PatrolGoals:
 
     def observation_step(self, env, sim):
         # Convert box pos, vel and rot_vel in torso frame
-        torso_frame = sim.data.get_body_xmat("torso/0").reshape(3, 3)
-        torso_pos = sim.data.get_body_xpos("torso/0")
+        torso_frame = env.handles.torso_xmat
+        torso_pos = env.handles.torso_xpos
 
         goal_rel_pos = self.goal_pos - torso_pos
         goal_state = goal_rel_pos.dot(torso_frame).ravel()
@@ -1,5 +1,4 @@
 import math
-from copy import deepcopy
 
 import numpy as np
 from scipy import signal
@@ -16,6 +15,10 @@ WALL_LENGTH = 0.5
 class Terrain:
     """Module for procedural generation of terrain."""
 
+    # Use the original band by band hfield synthesis. Output is identical
+    # for the same seed, only kept to verify (see tools/benchmark_env.py).
+    reference = False
+
     def __init__(self, random_state=None):
         self.terrain_types = cfg.TERRAIN.TYPES
         self.np_random = random_state
@@ -38,7 +41,7 @@ class Terrain:
 
     def _create_flat(self, size=None):
         """Create flat terrain."""
-        prev_segm = deepcopy(self.segms[-1])
+        prev_segm = self.segms[-1]
 
         if size:
             flat_len = size
@@ -54,7 +57,7 @@ class Terrain:
             if not flat_len:
                 return []
 
-        pos = prev_segm["pos"]
+        pos = list(prev_segm["pos"])
         pos[0] += prev_segm["len"] + flat_len
         name = "floor/{}".format(prev_segm["idx"] + 1)
         size = [flat_len, self.width, prev_segm["h"]]
@@ -92,6 +95,34 @@ class Terrain:
 
     def _create_rugged_square(self, nrow, ncol):
         """Create a bumpy terrain by clipping a triangle wave."""
+        if self.reference:
+            return self._create_rugged_square_reference(nrow, ncol)
+
+        # Draw band params in the same order as the reference, then fill all
+        # bands at once. Only two distinct waves (f = 10 or 15) exist.
+        widths, fs, clips = [], [], []
+        while sum(widths) < nrow:
+            widths.append(
+                su.sample_from_list(range(10, 20, 1), rng_state=self.np_random)
+            )
+            fs.append(su.sample_from_list([10, 15], rng_state=self.np_random))
+            clips.append(
+                su.sample_from_range(
+                    cfg.TERRAIN.RUGGED_SQUARE_CLIP_RANGE,
+                    rng_state=self.np_random,
+                )
+            )
+
+        waves = {
+            f: signal.sawtooth(np.linspace(0, f * np.pi, num=ncol), width=0.5)
+            + 1
+            for f in set(fs)
+        }
+        bands = np.stack([waves[f] for f in fs])
+        bands = np.minimum(bands, np.asarray(clips).reshape(-1, 1))
+        return np.repeat(bands, widths, axis=0)[:nrow]
+
+    def _create_rugged_square_reference(self, nrow, ncol):
         hfield_data = np.zeros((nrow, ncol))
         idx = 0
         while True:
@@ -129,7 +160,7 @@ class Terrain:
 
     def _create_hfield(self, segm_type):
         """Create hfield obstacles."""
-        prev_segm = deepcopy(self.segms[-1])
+        prev_segm = self.segms[-1]
         # Sample len and h of hfield
         if segm_type == "steps":
             len_range = cfg.TERRAIN.STEP_LENGTH_RANGE
@@ -144,7 +175,7 @@ class Terrain:
             return []
 
         # Create hfield asset
-        pos = prev_segm["pos"]
+        pos = list(prev_segm["pos"])
         pos[0] += prev_segm["len"] + hfield_len
         name = "floor/{}".format(prev_segm["idx"] + 1)
         nrow = self.width * self.divs * 2
@@ -392,9 +423,7 @@ class Terrain:
             start_pos += len(hfield)
 
     def observation_step(self, env, sim):
-        x_pos, y_pos, _ = sim.data.get_body_xpos("torso/0")
-        row_idx, col_idx = self.pos_to_idx([x_pos, y_pos])
-        return {"hfield_idx": np.asarray([row_idx, col_idx])}
+        return {"hfield_idx": env.terrain_ctx["hfield_idx"]}
 
     def pos_to_idx(self, pos):
         x_pos, y_pos = pos
@@ -11,6 +11,7 @@ from derl.utils import file as fu
 from derl.utils import geom as gu
 from derl.utils import mjpy as mu
 from derl.utils import sample as su
+from derl.utils import similarity as simu
 from derl.utils import xml as xu
 
 HEAD = "torso/0"
@@ -46,7 +47,7 @@ class SymmetricUnimal:
         self.init_state = None
         # Initalize xml from template
         # 从模板下载初始化xml
-        self.root, self.tree = xu.etree_from_xml(cfg.UNIMAL_TEMPLATE)
+        self.root, self.tree = xu.etree_from_cached_xml(cfg.UNIMAL_TEMPLATE)
         self.worldbody = self.root.findall("./worldbody")[0]
         self.actuator = self.root.findall("./actuator")[0]
         self.contact = self.root.findall("./contact")[0]
@@ -714,6 +715,13 @@ class SymmetricUnimal:
             if limbs2add == 2 and site_type == "growth_site":
                 exclude_geom_pairs.append((limbs[0], limbs[1]))
 
+            # Cheap analytic check, rejects most invalid unimals before
+            # compiling a sim. Survivors are checked exactly below.
+            if not self._is_valid_geometry(limbs, exclude_geom_pairs):
+                for cur_parent, cur_limb in zip(parents, limbs):
+                    cur_parent.remove(cur_limb)
+                continue
+
             # Check if new unimal is valid
             sim = mu.mjsim_from_etree(self.root)
             sim.step()
@@ -914,6 +922,82 @@ class SymmetricUnimal:
         normal_axis = cfg.BODY.SYMMETRY_PLANE.index(0)
         return unimal_com[normal_axis] == 0
 
+    def _geom_segments(self):
+        """Geoms of unimal as segments in world frame at qpos0.
+
+        Returns names, segment end points (N, 2, 3), radii and masses. The
+        head sphere is a segment with coincident end points. Bodies are never
+        rotated and joints are zero at qpos0, so body pos just add up.
+        """
+        names, ends, radii, masses = [], [], [], []
+        bodies = [(self.unimal, np.zeros(3))]
+        while bodies:
+            body, parent_pos = bodies.pop()
+            body_pos = parent_pos + xu.str2arr(body.get("pos"))
+            for geom in xu.find_elem(body, "geom", child_only=True):
+                r = float(geom.get("size"))
+                density = float(geom.get("density", 1000))
+                fromto = geom.get("fromto")
+                if fromto:
+                    fromto = xu.str2arr(fromto)
+                    p, q = body_pos + fromto[:3], body_pos + fromto[3:]
+                else:
+                    p, q = body_pos, body_pos
+                h = np.linalg.norm(q - p)
+                names.append(geom.get("name"))
+                ends.append([p, q])
+                radii.append(r)
+                masses.append(density * np.pi * r ** 2 * (h + 4 * r / 3))
+            bodies.extend(
+                (child, body_pos)
+                for child in xu.find_elem(body, "body", child_only=True)
+            )
+        return names, np.array(ends), np.array(radii), np.array(masses)
+
+    def _is_valid_geometry(self, limbs, exclude_geom_pairs):
+        """Analytic version of _is_symmetric and _new_contacts.
+
+        Conservative: only rejects unimals which the checks in sim would
+        also reject, i.e. com clearly off the symmetry plane or new limbs
+        clearly intersecting geoms other than the allowed pairs.
+        """
+        names, ends, radii, masses = self._geom_segments()
+
+        # Symmetry, com (geom centers weighted by mass) normal to plane
+        normal_axis = cfg.BODY.SYMMETRY_PLANE.index(0)
+        centers = ends.mean(axis=1)[:, normal_axis]
+        if abs(masses.dot(centers) / masses.sum()) > 1e-6:
+            return False
+
+        # Self intersection of new limbs
+        allowed_pairs = {tuple(sorted(pair)) for pair in self.contact_pairs}
+        allowed_pairs.update(
+            tuple(sorted((geom1.get("name"), geom2.get("name"))))
+            for (geom1, geom2) in exclude_geom_pairs
+        )
+        name2idx = {name: idx for idx, name in enumerate(names)}
+        new_idxs = [name2idx[limb.get("name")] for limb in limbs]
+        pairs = {
+            tuple(sorted((idx1, idx2)))
+            for idx1 in new_idxs
+            for idx2 in range(len(names))
+            if idx1 != idx2
+        }
+        pairs = [
+            pair
+            for pair in sorted(pairs)
+            if tuple(sorted((names[pair[0]], names[pair[1]])))
+            not in allowed_pairs
+        ]
+        if not pairs:
+            return True
+
+        idx1, idx2 = np.array(pairs).T
+        dists = gu.segment_dists(
+            ends[idx1, 0], ends[idx1, 1], ends[idx2, 0], ends[idx2, 1]
+        )
+        return not np.any(dists < radii[idx1] + radii[idx2] - 1e-6)
+
     def _new_contacts(self, sim, exclude_geom_pairs):
         """New contacts should only be between exclude_geom_pairs."""
 
@@ -1081,6 +1165,8 @@ class SymmetricUnimal:
         self._before_save()
         xml_path = os.path.join(cfg.OUT_DIR, "xml", "{}.xml".format(self.id))
         xu.save_etree_as_xml(self.tree, xml_path)
+        # Fill similarity metric cache while the xml is hot
+        simu.save_features(xml_path)
         if self.parent_id:
             mutation_op = self.curr_mutation
         else:
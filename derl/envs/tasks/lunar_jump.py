@@ -26,8 +26,8 @@ class LunarJumpTask(UnimalEnv, utils.EzPickle):
     - Rewards: jump_height (weighted heavy) + horizontal_distance + energy_penalty
     """
     
-    def __init__(self, xml_str, unimal_id):
-        UnimalEnv.__init__(self, xml_str, unimal_id)
+    def __init__(self, xml, unimal_id):
+        UnimalEnv.__init__(self, xml, unimal_id)
         
         # Store initial torso height for jump height calculation
         self.reset_torso_height = None
@@ -39,7 +39,7 @@ class LunarJumpTask(UnimalEnv, utils.EzPickle):
     
     def _calculate_jump_height(self):
         """Calculate maximum jump height from reset position"""
-        current_height = self.sim.data.get_body_xpos("torso/0")[2]
+        current_height = self.handles.torso_xpos[2]
         
         # Track maximum height during this episode
         if current_height > self.torso_height_max:
@@ -113,9 +113,9 @@ class LunarJumpTask(UnimalEnv, utils.EzPickle):
     
     def step_2d(self, action):
         """2D locomotion (forward movement on terrain)"""
-        xy_pos_before = self.sim.data.get_body_xpos("torso/0")[:2].copy()
+        xy_pos_before = self.handles.torso_xpos[:2].copy()
         self.do_simulation(action)
-        xy_pos_after = self.sim.data.get_body_xpos("torso/0")[:2].copy()
+        xy_pos_after = self.handles.torso_xpos[:2].copy()
         
         xy_vel = (xy_pos_after - xy_pos_before) / self.dt
         x_vel, y_vel = xy_vel
@@ -137,7 +137,7 @@ class LunarJumpTask(UnimalEnv, utils.EzPickle):
         obs = super().reset()
         
         # Initialize jump height tracking
-        self.reset_torso_height = self.sim.data.get_body_xpos("torso/0")[2]
+        self.reset_torso_height = self.handles.torso_xpos[2]
         self.torso_height_max = self.reset_torso_height
         
         return obs
@@ -1,8 +1,6 @@
 import numpy as np
 from gym import utils
-from scipy.spatial import distance as scipy_distance
 
-import derl.utils.mjpy as mu
 from derl.config import cfg
 from derl.envs.modules.agent import Agent
 from derl.envs.modules.objects import Objects
@@ -12,43 +10,54 @@ from derl.envs.wrappers.hfield import StandReward
 from derl.envs.wrappers.hfield import TerminateOnFalling
 from derl.envs.wrappers.hfield import UnimalHeightObs
 from derl.envs.wrappers.metrics import ManipulationMetric
+from derl.utils import geom as gu
 
 
 class ManipulationTask(UnimalEnv, utils.EzPickle):
-    def __init__(self, xml_str, unimal_id):
-        UnimalEnv.__init__(self, xml_str, unimal_id)
+    def __init__(self, xml, unimal_id):
+        UnimalEnv.__init__(self, xml, unimal_id)
         self.obj_type = cfg.OBJECT.TYPE
         self.obj_name = "{}/1".format(self.obj_type)
+        # Shared across steps, only updated in place on reset
+        self.goal_pos = np.zeros(2)
 
-    def _cal_agent_obj_dist(self):
-        agent_pos = [
-            self.sim.data.get_site_xpos(agent_site).copy()
-            for agent_site in self.metadata["agent_sites"]
-        ]
+    def _resolve_obj_ids(self):
+        """Cache ids of obj elems used every step, handles change on reset."""
+        self.obj_body_id = self.handles.id("body", self.obj_name)
         if self.obj_type == "box":
-            obj_pos = [
-                self.sim.data.get_site_xpos(obj_site).copy()
-                for obj_site in self.metadata["object_sites"]
-            ]
+            self.obj_site_ids = np.array(
+                [
+                    self.handles.id("site", obj_site)
+                    for obj_site in self.metadata["object_sites"]
+                ],
+                dtype=int,
+            )
         else:
-            obj_pos = [
-                self.sim.data.get_body_xpos(self.obj_name).copy()
-            ]
+            self.obj_site_ids = None
 
-        distance = scipy_distance.cdist(agent_pos, obj_pos, "euclidean")
-        return np.min(distance)
+    def _cal_agent_obj_dist(self):
+        if self.obj_site_ids is not None:
+            obj_pos = self.sim.data.site_xpos[self.obj_site_ids]
+        else:
+            obj_pos = self.sim.data.body_xpos[
+                self.obj_body_id:self.obj_body_id + 1
+            ]
+        return gu.min_dist(self.handles.agent_site_xpos, obj_pos)
 
     ###########################################################################
     # Sim step and reset
     ###########################################################################
     def step(self, action):
-        agent_obj_d_before = self._cal_agent_obj_dist()
-        obj_pos_before = self.sim.data.get_body_xpos(self.obj_name)[:2].copy()
+        # Pre step values are the post step values of the previous step
+        agent_obj_d_before = self.agent_obj_d
+        obj_pos_before = self.obj_pos
         self.do_simulation(action)
 
-        xy_pos_after = self.sim.data.get_body_xpos("torso/0")[:2].copy()
+        xy_pos_after = self.handles.torso_xpos[:2].copy()
         agent_obj_d_after = self._cal_agent_obj_dist()
-        obj_pos_after = self.sim.data.get_body_xpos(self.obj_name)[:2].copy()
+        obj_pos_after = self.sim.data.body_xpos[self.obj_body_id][:2].copy()
+        self.agent_obj_d = agent_obj_d_after
+        self.obj_pos = obj_pos_after
 
         # Reward given to agent to reach/or be near to obj
         reach_reward = (agent_obj_d_before - agent_obj_d_after) * 100.0
@@ -61,7 +70,7 @@ class ManipulationTask(UnimalEnv, utils.EzPickle):
 
         # Reward given to agent to "push" obj to be near to goal
         push_reward = 0.0
-        goal_pos = self.modules["Objects"].goal_pos[:2]
+        goal_pos = self.goal_pos
         obj_goal_d_after = None
         agent_goal_d_after = None
         if self.reached_obj:
@@ -82,7 +91,6 @@ class ManipulationTask(UnimalEnv, utils.EzPickle):
 
         info = {
             "x_pos": xy_pos_after[0],
-            "y_pos": xy_pos_after[1],
             "__reward__reach": reach_reward,
             "__reward__push": push_reward,
             "__reward__energy": self.calculate_energy(),
@@ -90,7 +98,7 @@ class ManipulationTask(UnimalEnv, utils.EzPickle):
             "__reward__manipulation": reach_reward + push_reward,
             "agent_obj_d_after": agent_obj_d_after,
             "agent_goal_d_after": agent_goal_d_after,
-            "goal_pos": np.asarray(goal_pos),
+            "goal_pos": goal_pos.copy(),
             "reached_obj": self.reached_obj,
             "reach_goal_obj": self.reach_goal_obj,
             "reach_goal_agent": self.reach_goal_agent,
@@ -111,10 +119,11 @@ class ManipulationTask(UnimalEnv, utils.EzPickle):
         self.reached_obj = False
         self.reach_goal_agent = False
         self.reach_goal_obj = False
-        self.init_obj_goal_d = np.linalg.norm(
-            np.asarray(self.modules["Objects"].goal_pos[:2])
-            - np.asarray(self.sim.data.get_body_xpos(self.obj_name)[:2])
-        )
+        self._resolve_obj_ids()
+        self.goal_pos[:] = self.modules["Objects"].goal_pos[:2]
+        self.agent_obj_d = self._cal_agent_obj_dist()
+        self.obj_pos = self.sim.data.body_xpos[self.obj_body_id][:2].copy()
+        self.init_obj_goal_d = np.linalg.norm(self.goal_pos - self.obj_pos)
         return obs
 
 
@@ -13,17 +13,17 @@ from derl.envs.wrappers.hfield import UnimalHeightObs
 
 
 class ObstacleTask(UnimalEnv, utils.EzPickle):
-    def __init__(self, xml_str, unimal_id):
-        UnimalEnv.__init__(self, xml_str, unimal_id)
+    def __init__(self, xml, unimal_id):
+        UnimalEnv.__init__(self, xml, unimal_id)
 
     ###########################################################################
     # Sim step and reset
     ###########################################################################
 
     def step(self, action):
-        xy_pos_before = self.sim.data.get_body_xpos("torso/0")[:2].copy()
+        xy_pos_before = self.handles.torso_xpos[:2].copy()
         self.do_simulation(action)
-        xy_pos_after = self.sim.data.get_body_xpos("torso/0")[:2].copy()
+        xy_pos_after = self.handles.torso_xpos[:2].copy()
 
         xy_vel = (xy_pos_after - xy_pos_before) / self.dt
         x_vel, y_vel = xy_vel
@@ -1,6 +1,5 @@
 import numpy as np
 from gym import utils
-from scipy.spatial import distance as scipy_distance
 
 from derl.config import cfg
 from derl.envs.modules.agent import Agent
@@ -10,38 +9,47 @@ from derl.envs.tasks.unimal import UnimalEnv
 from derl.envs.wrappers.hfield import StandReward
 from derl.envs.wrappers.hfield import TerminateOnFalling
 from derl.envs.wrappers.hfield import UnimalHeightObs
+from derl.utils import geom as gu
 
 
 class PushBoxIncline(UnimalEnv, utils.EzPickle):
-    def __init__(self, xml_str, unimal_id):
-        UnimalEnv.__init__(self, xml_str, unimal_id)
+    def __init__(self, xml, unimal_id):
+        UnimalEnv.__init__(self, xml, unimal_id)
         self.obj_type = cfg.OBJECT.TYPE
         self.obj_name = "{}/1".format(self.obj_type)
         self.angle = np.deg2rad(abs(cfg.TERRAIN.INCLINE_ANGLE))
+        # Shared across steps, only updated in place on reset
+        self.goal_pos = np.zeros(2)
+
+    def _resolve_obj_ids(self):
+        """Cache ids of obj elems used every step, handles change on reset."""
+        self.obj_body_id = self.handles.id("body", self.obj_name)
+        self.obj_site_ids = np.array(
+            [
+                self.handles.id("site", obj_site)
+                for obj_site in self.metadata["object_sites"]
+            ],
+            dtype=int,
+        )
 
     def _cal_agent_obj_dist(self):
-        agent_pos = [
-            self.sim.data.get_site_xpos(agent_site).copy()
-            for agent_site in self.metadata["agent_sites"]
-        ]
-        obj_pos = [
-            self.sim.data.get_site_xpos(obj_site).copy()
-            for obj_site in self.metadata["object_sites"]
-        ]
-        distance = scipy_distance.cdist(agent_pos, obj_pos, "euclidean")
-        return np.min(distance)
+        obj_pos = self.sim.data.site_xpos[self.obj_site_ids]
+        return gu.min_dist(self.handles.agent_site_xpos, obj_pos)
 
     ###########################################################################
     # Sim step and reset
     ###########################################################################
     def step(self, action):
-        agent_obj_d_before = self._cal_agent_obj_dist()
-        obj_pos_before = self.sim.data.get_body_xpos(self.obj_name)[:2].copy()
+        # Pre step values are the post step values of the previous step
+        agent_obj_d_before = self.agent_obj_d
+        obj_pos_before = self.obj_pos
         self.do_simulation(action)
 
-        xy_pos_after = self.sim.data.get_body_xpos("torso/0")[:2].copy()
+        xy_pos_after = self.handles.torso_xpos[:2].copy()
         agent_obj_d_after = self._cal_agent_obj_dist()
-        obj_pos_after = self.sim.data.get_body_xpos(self.obj_name)[:2].copy()
+        obj_pos_after = self.sim.data.body_xpos[self.obj_body_id][:2].copy()
+        self.agent_obj_d = agent_obj_d_after
+        self.obj_pos = obj_pos_after
 
         # Reward given to agent to reach/or be near to obj
         reach_reward = (agent_obj_d_before - agent_obj_d_after) * 100.0
@@ -54,7 +62,7 @@ class PushBoxIncline(UnimalEnv, utils.EzPickle):
 
         # Reward given to agent to "push" obj to be near to goal
         push_reward = 0.0
-        goal_pos = self.modules["Objects"].goal_pos[:2]
+        goal_pos = self.goal_pos
         obj_goal_d_after = None
         if self.reached_obj:
             obj_goal_d_before = np.linalg.norm(goal_pos - obj_pos_before)
@@ -75,7 +83,6 @@ class PushBoxIncline(UnimalEnv, utils.EzPickle):
 
         info = {
             "x_pos": xy_pos_after[0],
-            "y_pos": xy_pos_after[1],
             "__reward__reach": reach_reward,
             "__reward__push": push_reward,
             "__reward__energy": self.calculate_energy(),
@@ -97,6 +104,10 @@ class PushBoxIncline(UnimalEnv, utils.EzPickle):
         self.reached_obj = False
         self.reach_goal_agent = False
         self.reach_goal_obj = False
+        self._resolve_obj_ids()
+        self.goal_pos[:] = self.modules["Objects"].goal_pos[:2]
+        self.agent_obj_d = self._cal_agent_obj_dist()
+        self.obj_pos = self.sim.data.body_xpos[self.obj_body_id][:2].copy()
         return obs
 
 
@@ -1,6 +1,6 @@
 import derl.utils.xml as xu
 from derl.config import cfg
-from derl.envs.modules.agent import extract_agent_from_xml
+from derl.config import fidelity_preset
 from derl.envs.modules.agent import merge_agent_with_base
 from derl.envs.tasks.escape_bowl import make_env_escape_bowl
 from derl.envs.tasks.exploration import make_env_exploration
@@ -16,9 +16,7 @@ from derl.envs.wrappers.select_keys import SelectKeysWrapper
 from derl.utils import file as fu
 
 
-def modify_xml_attributes(xml):
-    root, tree = xu.etree_from_xml(xml, ispath=False)
-
+def modify_xml_attributes(root):
     # Modify njmax and nconmax
     size = xu.find_elem(root, "size")[0]
     size.set("njmax", str(cfg.XML.NJMAX))
@@ -28,9 +26,17 @@ def modify_xml_attributes(xml):
     flag = xu.find_elem(root, "flag")[0]
     flag.set("filterparent", str(cfg.XML.FILTER_PARENT))
 
+    # Set solver params of the fidelity preset
+    preset = fidelity_preset()
+    option = xu.find_elem(root, "option")[0]
+    option.set("timestep", str(preset["timestep"]))
+    option.set("iterations", str(preset["iterations"]))
+    option.set("tolerance", str(preset["tolerance"]))
+
     # Modify default geom params
+    condim = preset["condim"] or cfg.XML.GEOM_CONDIM
     default_geom = xu.find_elem(root, "geom")[0]
-    default_geom.set("condim", str(cfg.XML.GEOM_CONDIM))
+    default_geom.set("condim", str(condim))
     default_geom.set("friction", xu.arr2str(cfg.XML.GEOM_FRICTION))
 
     # Modify njmax and nconmax
@@ -38,21 +44,21 @@ def modify_xml_attributes(xml):
     map_ = xu.find_elem(visual, "map")[0]
     map_.set("shadowclip", str(cfg.XML.SHADOWCLIP))
 
-    return xu.etree_to_str(root)
+    return root
 
 
 def make_env(xml_path=None):
+    # The xml is parsed once per process (all envs of a unimal share it) and
+    # the same etree is passed on till the env compiles it in
+    # UnimalEnv._get_sim.
     if xml_path:
-        agent = xml_path
-        agent = extract_agent_from_xml(agent)
-        ispath = False
+        agent_root, _ = xu.etree_from_cached_xml(xml_path)
         unimal_id = fu.path2id(xml_path)
     else:
-        agent = cfg.ENV.WALKER
-        ispath = True
+        agent_root, _ = xu.etree_from_cached_xml(cfg.ENV.WALKER)
         unimal_id = ""
 
-    xml = merge_agent_with_base(agent, ispath)
+    xml = merge_agent_with_base(agent_root)
     xml = modify_xml_attributes(xml)
 
     env_func = "make_env_{}".format(cfg.ENV.TASK)
@@ -8,6 +8,8 @@ from gym.utils import seeding
 
 import derl.utils.exception as exu
 from derl.config import cfg
+from derl.config import fidelity_preset
+from derl.utils import mjpy as mu
 from derl.utils import spaces as spu
 from derl.utils import xml as xu
 
@@ -23,13 +25,16 @@ DEFAULT_CAMERA_CONFIG = {
 class UnimalEnv(gym.Env):
     """Superclass for all Unimal tasks."""
 
-    def __init__(self, xml_str, unimal_id):
-        self.frame_skip = 4
+    def __init__(self, xml, unimal_id):
+        self.frame_skip = fidelity_preset()["frame_skip"]
+        # Set by mu.SimBatch when sims of several envs are stepped together
+        self.sim_batch = None
 
         self.viewer = None
         self._viewers = {}
 
-        self.xml_str = xml_str
+        # Etree root of the env xml, copied (not re-parsed) on every reset
+        self.xml = xml
         self.metadata = {
             "render.modes": ["human", "rgb_array", "depth_array"],
             "unimal_id": unimal_id,
@@ -52,15 +57,51 @@ class UnimalEnv(gym.Env):
             self.modules[name_str].np_random = self.np_random
 
     def _get_obs(self):
+        self._update_terrain_ctx()
         obs = {}
         for _, module in self.modules.items():
             # 合并所有模块的观测
             obs.update(module.observation_step(self, self.sim))
         return obs
 
+    def _update_terrain_ctx(self):
+        """Torso pos, hfield idx and height above terrain, shared per step by
+        modules and wrappers."""
+        torso_xpos = self.handles.torso_xpos.copy()
+        ctx = {"torso_xpos": torso_xpos, "hfield_idx": None}
+
+        # Height of ground is constant if Floor
+        if "Floor" in cfg.ENV.MODULES:
+            ctx["terrain_z"] = 1.0
+            ctx["torso_height"] = round(torso_xpos[2] - 1, 3)
+            self.terrain_ctx = ctx
+            return
+
+        hfield_module = self.modules.get("Terrain", self.modules.get("Bowl"))
+        if hfield_module is None:
+            ctx["terrain_z"] = 0.0
+            ctx["torso_height"] = round(torso_xpos[2], 3)
+            self.terrain_ctx = ctx
+            return
+
+        row_idx, col_idx = hfield_module.pos_to_idx(torso_xpos[:2])
+        ctx["hfield_idx"] = np.asarray([row_idx, col_idx])
+        try:
+            terrain_z = self.metadata["hfield"][row_idx, col_idx]
+        except IndexError as e:
+            uid = self.metadata["unimal_id"]
+            exu.handle_exception(
+                e, "ERROR in Hfield: {}".format(uid), unimal_id=uid
+            )
+        # In case of gap terrain_z will be negative, clip at 0
+        if cfg.ENV.TASK not in ["incline", "push_box_incline"]:
+            terrain_z = max(0, terrain_z)
+        ctx["terrain_z"] = terrain_z
+        ctx["torso_height"] = round(torso_xpos[2] - terrain_z, 3)
+        self.terrain_ctx = ctx
+
     def _get_sim(self):
-        
-        root, tree = xu.etree_from_xml(self.xml_str, ispath=False)
+        root, tree = xu.copy_etree(self.xml)
         self._init_modules()
         # Modify the xml
         # 每一个模块修改xml
@@ -74,7 +115,10 @@ class UnimalEnv(gym.Env):
         # Apply gravity configuration if specified
         if hasattr(cfg.ENV, 'GRAVITY') and cfg.ENV.GRAVITY is not None:
             sim.model.opt.gravity[2] = -cfg.ENV.GRAVITY
-        
+
+        # Resolve ids of elems accessed every step
+        self.handles = mu.SimHandles(sim)
+
         # Update module fields which require sim
         for _, module in self.modules.items():
             module.modify_sim_step(self, sim)
@@ -170,6 +214,15 @@ class UnimalEnv(gym.Env):
     def do_simulation(self, ctrl):
         self.step_count += 1
         self.sim.data.ctrl[:] = ctrl
+        if self.sim_batch is not None:
+            if self.sim_batch.wait(self):
+                uid = self.metadata["unimal_id"]
+                exu.handle_exception(
+                    mujoco_py.MujocoException("Got MuJoCo Warning"),
+                    "ERROR in MjStep: {}".format(uid),
+                    unimal_id=uid,
+                )
+            return
         for _ in range(self.frame_skip):
             try:
                 self.sim.step()
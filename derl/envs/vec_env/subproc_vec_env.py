@@ -2,12 +2,14 @@ import multiprocessing as mp
 
 import numpy as np
 
+from derl.utils import mjpy as mu
+
 from .vec_env import CloudpickleWrapper
 from .vec_env import VecEnv
 from .vec_env import clear_mpi_env_vars
 
 
-def worker(remote, parent_remote, env_fn_wrappers):
+def worker(remote, parent_remote, env_fn_wrappers, batch_sims=False):
     def step_env(env, action):
         ob, reward, done, info = env.step(action)
         if done:
@@ -16,10 +18,15 @@ def worker(remote, parent_remote, env_fn_wrappers):
 
     parent_remote.close()
     envs = [env_fn_wrapper() for env_fn_wrapper in env_fn_wrappers.x]
+    sim_batch = None
+    if batch_sims and len(envs) > 1:
+        sim_batch = mu.SimBatch(envs)
     try:
         while True:
             cmd, data = remote.recv()
-            if cmd == "step":
+            if cmd == "step" and sim_batch is not None:
+                remote.send(sim_batch.map(step_env, envs, data))
+            elif cmd == "step":
                 remote.send(
                     [step_env(env, action) for env, action in zip(envs, data)]
                 )
@@ -45,6 +52,8 @@ def worker(remote, parent_remote, env_fn_wrappers):
     except KeyboardInterrupt:
         print("SubprocVecEnv worker: got KeyboardInterrupt")
     finally:
+        if sim_batch is not None:
+            sim_batch.close()
         for env in envs:
             env.close()
 
@@ -55,13 +64,16 @@ class SubprocVecEnv(VecEnv):
     Recommended to use when num_envs > 1 and step() can be a bottleneck.
     """
 
-    def __init__(self, env_fns, spaces=None, context="spawn", in_series=1):
+    def __init__(
+        self, env_fns, spaces=None, context="spawn", in_series=1, batch_sims=False
+    ):
         """
         Arguments:
 
         env_fns: iterable of callables -  functions that create environments to run in subprocesses. Need to be cloud-pickleable
         in_series: number of environments to run in series in a single process
         (e.g. when len(env_fns) == 12 and in_series == 3, it will run 4 processes, each running 3 envs in series)
+        batch_sims: step the mujoco sims of the envs in a process together, see mu.SimBatch
         """
         self.waiting = False
         self.closed = False
@@ -79,7 +91,9 @@ class SubprocVecEnv(VecEnv):
         self.ps = [
             ctx.Process(
                 target=worker,
-                args=(work_remote, remote, CloudpickleWrapper(env_fn)),
+                args=(
+                    work_remote, remote, CloudpickleWrapper(env_fn), batch_sims
+                ),
             )
             for (work_remote, remote, env_fn) in zip(
                 self.work_remotes, self.remotes, env_fns
@@ -0,0 +1,67 @@
+import gym
+
+
+class PostStepWrapper(gym.Wrapper):
+    """Wrapper whose step only post processes the output of env.step.
+
+    Keeping the logic in post_step lets CompiledEnv call it without going
+    through the nested step chain.
+    """
+
+    def step(self, action):
+        return self.post_step(*self.env.step(action))
+
+    def post_step(self, obs, rew, done, info):
+        return obs, rew, done, info
+
+
+def _post_step_hook(layer):
+    """Returns post step hook of layer or None if it can't be flattened."""
+    step = type(layer).step
+    if step is PostStepWrapper.step:
+        return layer.post_step
+    if step is gym.ObservationWrapper.step:
+        return lambda obs, rew, done, info: (
+            layer.observation(obs), rew, done, info
+        )
+    if step is gym.RewardWrapper.step:
+        return lambda obs, rew, done, info: (
+            obs, layer.reward(rew), done, info
+        )
+    return None
+
+
+class CompiledEnv(gym.Wrapper):
+    """Flattened wrapper stack.
+
+    Steps the innermost env and applies the post step hooks of all wrappers
+    in order (inner to outer), which is exactly what the nested step calls
+    do. Wrappers with arbitrary step logic (e.g. gym TimeLimit) are kept
+    as is and the stack below them is compiled separately. Reset, attribute
+    access and wrapper state are unchanged.
+    """
+
+    def __init__(self, env):
+        super().__init__(env)
+        hooks = []
+        layer = env
+        while isinstance(layer, gym.Wrapper) and not isinstance(
+            layer, CompiledEnv
+        ):
+            hook = _post_step_hook(layer)
+            if hook is None:
+                if isinstance(layer.env, gym.Wrapper) and not isinstance(
+                    layer.env, CompiledEnv
+                ):
+                    layer.env = CompiledEnv(layer.env)
+                break
+            hooks.append(hook)
+            layer = layer.env
+        self.base_step = layer.step
+        self.hooks = hooks[::-1]
+
+    def step(self, action):
+        obs, rew, done, info = self.base_step(action)
+        for hook in self.hooks:
+            obs, rew, done, info = hook(obs, rew, done, info)
+        return obs, rew, done, info
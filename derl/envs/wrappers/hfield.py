@@ -5,9 +5,9 @@ import gym
 import numpy as np
 
 from derl.config import cfg
+from derl.envs.wrappers.compiled import PostStepWrapper
 from derl.utils import exception as exu
 from derl.utils import geom as gu
-from derl.utils import mjpy as mu
 from derl.utils import spaces as spu
 
 np.set_printoptions(threshold=sys.maxsize)
@@ -28,7 +28,6 @@ class HfieldObs1D(gym.ObservationWrapper):
     def observation(self, obs):
         hfield = self.metadata["hfield"]
         behind, front, _, _ = [_ * self.divs for _ in cfg.HFIELD.OBS_SIZE]
-        x_pos, y_pos, _ = self.unwrapped.sim.data.get_body_xpos("torso/0")
         _, col_idx = obs["hfield_idx"]
 
         c_min = col_idx - behind
@@ -41,7 +40,7 @@ class HfieldObs1D(gym.ObservationWrapper):
         return obs
 
 
-class HfieldObs2D(gym.Wrapper):
+class HfieldObs2D(PostStepWrapper):
     def __init__(self, env):
         super().__init__(env)
 
@@ -62,29 +61,26 @@ class HfieldObs2D(gym.Wrapper):
         obs = self._add_hfield_obs(obs, None)
         return obs
 
-    def step(self, action):
-        obs, rew, done, info = self.env.step(action)
+    def post_step(self, obs, rew, done, info):
         obs = self._add_hfield_obs(obs, info)
         return obs, rew, done, info
 
     def _add_hfield_obs(self, obs, info):
-        sim = self.unwrapped.sim
         hfield = self.metadata["hfield"]
-        x_pos, y_pos, _ = sim.data.get_body_xpos("torso/0")
 
         # Get un-rotated mask
         mask_row, mask_col = self.mask_row, self.mask_col
 
         # Maybe rotate the mask. Original x-axis of torso frame was (1, 0, 0).
         # Get current torso x-axis and rotate mask accordingly
-        torso_frame = sim.data.get_body_xmat("torso/0").reshape(3, 3)
+        torso_frame = self.unwrapped.handles.torso_xmat
         x_dir = gu.normalize_vec(torso_frame[:, 0][:2])
         if info:
             rot_angle = gu.angle_between([1, 0], x_dir)
             mask_row, mask_col = self._rotate_mask(rot_angle)
 
         # Translate the mask
-        row_idx, col_idx = obs["hfield_idx"]
+        row_idx, col_idx = self.unwrapped.terrain_ctx["hfield_idx"]
         mask_row = mask_row + row_idx
         mask_col = mask_col + col_idx
 
@@ -202,25 +198,7 @@ class UnimalHeightObs(gym.ObservationWrapper):
         self.observation_space = spu.update_obs_space(env, {"torso_height": (1,)})
 
     def observation(self, obs):
-        x_pos, y_pos, z_pos = self.sim.data.get_body_xpos("torso/0")
-
-        # Height of ground is constant if Floor
-        if "Floor" in cfg.ENV.MODULES:
-            obs["torso_height"] = round(z_pos - 1, 3)
-            return obs
-
-        row_idx, col_idx = obs["hfield_idx"]
-        try:
-            terrain_z = self.metadata["hfield"][row_idx, col_idx]
-            # In case of gap terrain_z will be negative, clip at 0
-            if cfg.ENV.TASK not in ["incline", "push_box_incline"]:
-                terrain_z = max(0, terrain_z)
-        except IndexError as e:
-            uid = self.metadata["unimal_id"]
-            exu.handle_exception(
-                e, "ERROR in Hfield: {}".format(uid), unimal_id=uid
-            )
-        obs["torso_height"] = round(z_pos - terrain_z, 3)
+        obs["torso_height"] = self.unwrapped.terrain_ctx["torso_height"]
         return obs
 
 
@@ -229,18 +207,17 @@ class UnimalHeightObs(gym.ObservationWrapper):
 
 class AvoidWallReward(gym.RewardWrapper):
     def reward(self, reward):
-        if check_agent_wall_contact(self.unwrapped.sim):
+        if check_agent_wall_contact(self.unwrapped.handles):
             reward = reward - cfg.ENV.AVOID_REWARD_WEIGHT
         return reward
 
 
-class StandReward(gym.Wrapper):
+class StandReward(PostStepWrapper):
     def __init__(self, env):
         super().__init__(env)
         self.orig_height = env.metadata["orig_height"]
 
-    def step(self, action):
-        obs, rew, done, info = self.env.step(action)
+    def post_step(self, obs, rew, done, info):
         stand_reward = (
             min(obs["torso_height"], 2.0 * self.orig_height)
             * cfg.ENV.STAND_REWARD_WEIGHT
@@ -250,7 +227,7 @@ class StandReward(gym.Wrapper):
         return obs, rew, done, info
 
 
-class ExploreTerrainReward(gym.Wrapper):
+class ExploreTerrainReward(PostStepWrapper):
     def __init__(self, env):
         super().__init__(env)
         l, w, _ = cfg.TERRAIN.SIZE
@@ -262,8 +239,7 @@ class ExploreTerrainReward(gym.Wrapper):
         self.visit_grid[:, :] = 0.0
         return obs
 
-    def step(self, action):
-        obs, rew, done, info = self.env.step(action)
+    def post_step(self, obs, rew, done, info):
         prev_visit_count = np.sum(self.visit_grid)
         row_idx, col_idx = obs["placement_idx"]
         try:
@@ -283,53 +259,50 @@ class ExploreTerrainReward(gym.Wrapper):
 """Termination Wrappers."""
 
 
-class TerminateOnWallContact(gym.Wrapper):
-    def step(self, action):
-        obs, rew, done, info = self.env.step(action)
-        if check_agent_wall_contact(self.unwrapped.sim):
+class TerminateOnWallContact(PostStepWrapper):
+    def post_step(self, obs, rew, done, info):
+        if check_agent_wall_contact(self.unwrapped.handles):
             done = True
             rew = rew - cfg.ENV.AVOID_REWARD_WEIGHT
         return obs, rew, done, info
 
 
-class TerminateOnTerrainEdge(gym.Wrapper):
+class TerminateOnTerrainEdge(PostStepWrapper):
     """Terminate episode if unimals are near edge of terrain (along y dir)."""
 
-    def step(self, action):
-        obs, rew, done, info = self.env.step(action)
+    def post_step(self, obs, rew, done, info):
         if self.is_near_edge():
             done = True
         return obs, rew, done, info
 
     def is_near_edge(self):
-        x_pos, y_pos, _ = self.sim.data.get_body_xpos("torso/0")
+        x_pos, y_pos, _ = self.unwrapped.handles.torso_xpos
         if cfg.TERRAIN.SIZE[1] - abs(y_pos) <= 1:
             return True
         else:
             return False
 
 
-class TerminateOnFalling(gym.Wrapper):
+class TerminateOnFalling(PostStepWrapper):
     """Teriminate episode if torso falls below a certain height."""
 
     def __init__(self, env):
         super().__init__(env)
         self.fall_threshold = env.metadata["fall_threshold"]
 
-    def step(self, action):
-        obs, rew, done, info = self.env.step(action)
-        if self.has_fallen(obs):
+    def post_step(self, obs, rew, done, info):
+        if self.has_fallen():
             done = True
         return obs, rew, done, info
 
-    def has_fallen(self, obs):
-        if obs["torso_height"] <= self.fall_threshold:
+    def has_fallen(self):
+        if self.unwrapped.terrain_ctx["torso_height"] <= self.fall_threshold:
             return True
         else:
             return False
 
 
-class TerminateOnRotation(gym.Wrapper):
+class TerminateOnRotation(PostStepWrapper):
     """Teriminate episode if unimal does cartwheel!"""
 
     def __init__(self, env):
@@ -337,8 +310,7 @@ class TerminateOnRotation(gym.Wrapper):
         self.sum = 0
         self.count = 0
 
-    def step(self, action):
-        obs, rew, done, info = self.env.step(action)
+    def post_step(self, obs, rew, done, info):
         if self.is_rotating(obs):
             done = True
 
@@ -360,9 +332,8 @@ class TerminateOnRotation(gym.Wrapper):
             return False
 
 
-class TerminateOnEscape(gym.Wrapper):
-    def step(self, action):
-        obs, rew, done, info = self.env.step(action)
+class TerminateOnEscape(PostStepWrapper):
+    def post_step(self, obs, rew, done, info):
         # Due to computational reasons we will never have hfield obs size more
         # than 5 (diag would be ~7, we keep some buffer and make it 8)
         if info["metric"] >= cfg.TERRAIN.SIZE[0] - 8:
@@ -371,9 +342,6 @@ class TerminateOnEscape(gym.Wrapper):
         return obs, rew, done, info
 
 
-def check_agent_wall_contact(sim):
-    contact_geoms = mu.get_active_contacts(sim)
-    contact_geoms = [
-        name for contact in contact_geoms for name in contact if "wall" in name
-    ]
-    return contact_geoms
+def check_agent_wall_contact(handles):
+    """Return True if any active contact involves a wall geom."""
+    return handles.has_contact("wall")
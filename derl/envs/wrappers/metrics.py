@@ -1,10 +1,10 @@
-import gym
 import numpy as np
 
 from derl.config import cfg
+from derl.envs.wrappers.compiled import PostStepWrapper
 
 
-class ReachMetric(gym.Wrapper):
+class ReachMetric(PostStepWrapper):
     """Calculate human interpretable metric for PointNav task."""
 
     def __init__(self, env):
@@ -17,8 +17,7 @@ class ReachMetric(gym.Wrapper):
         else:
             return False
 
-    def step(self, action):
-        obs, rew, done, info = self.env.step(action)
+    def post_step(self, obs, rew, done, info):
 
         if not self.is_done(done):
             if "__reward__success" in info:
@@ -41,7 +40,7 @@ class ReachMetric(gym.Wrapper):
         return obs, rew, done, info
 
 
-class ManipulationMetric(gym.Wrapper):
+class ManipulationMetric(PostStepWrapper):
     """Calculate human interpretable metric for Manipulation task."""
 
     def __init__(self, env):
@@ -54,8 +53,7 @@ class ManipulationMetric(gym.Wrapper):
         else:
             return False
 
-    def step(self, action):
-        obs, rew, done, info = self.env.step(action)
+    def post_step(self, obs, rew, done, info):
 
         if not self.is_done(done):
             if info["reach_goal_obj"] and info["reach_goal_agent"]:
@@ -91,7 +89,7 @@ class ManipulationMetric(gym.Wrapper):
         return obs
 
 
-class PatrolMetric(gym.Wrapper):
+class PatrolMetric(PostStepWrapper):
     """Calculate human interpretable metric for Patrol task."""
 
     def __init__(self, env):
@@ -104,8 +102,7 @@ class PatrolMetric(gym.Wrapper):
         else:
             return False
 
-    def step(self, action):
-        obs, rew, done, info = self.env.step(action)
+    def post_step(self, obs, rew, done, info):
 
         if not self.is_done(done):
             self.total_toggles += info["toggle"]
@@ -1,14 +1,13 @@
-import gym
 import numpy as np
 
 from derl.config import cfg
+from derl.envs.wrappers.compiled import PostStepWrapper
 
 
-class ReachReward(gym.Wrapper):
+class ReachReward(PostStepWrapper):
     """Reach reward used in PointNav task."""
 
-    def step(self, action):
-        obs, rew, done, info = self.env.step(action)
+    def post_step(self, obs, rew, done, info):
 
         agent_goal_d_before = np.linalg.norm(
             info["goal_pos"] - info["xy_pos_before"]
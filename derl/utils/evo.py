@@ -1,5 +1,7 @@
+import json
 import os
 import random
+from collections import defaultdict
 
 import numpy as np
 
@@ -57,7 +59,7 @@ def get_dominate_mask(metadatas):
 
 def aging_tournament():
     # 获取metadata文件夹中的所有JSON文件路径
-    metadata_paths = fu.get_files(fu.get_subfolder("metadata"), ".*json")
+    metadata_paths = fu.get_files(fu.get_subfolder("metadata"), ".*json$")
     # 按修改时间排序
     metadata_paths = sorted(metadata_paths, key=os.path.getmtime)
     # 只保留最近的AGING_WINDOW_SIZE个unimals
@@ -91,7 +93,7 @@ def aging_tournament():
 
 # 锦标赛选择（无年龄机制）
 def vanilla_tournament():
-    metadata_paths = fu.get_files(fu.get_subfolder("metadata"), ".*json")
+    metadata_paths = fu.get_files(fu.get_subfolder("metadata"), ".*json$")
 
     num_unimals = cfg.EVO.NUM_PARTICIPANTS
 
@@ -126,12 +128,12 @@ def get_parent_id(child_id):
 
 def get_searched_space_size():
     """Returns total number of unimals generated so far."""
-    return len(os.listdir(fu.get_subfolder("models")))
+    return len(fu.get_files(fu.get_subfolder("models"), "[^.].*"))
 
 
 def get_population_size():
     """Return the current population size."""
-    return len(os.listdir(fu.get_subfolder("metadata")))
+    return len(fu.get_files(fu.get_subfolder("metadata"), ".*json$"))
 
 
 def should_save_video():
@@ -159,9 +161,102 @@ def get_metadata_paths(metadata_dir=None):
     if metadata_dir is None:
         metadata_dir = fu.get_subfolder("metadata")
     metadata_paths = fu.get_files(
-        metadata_dir, ".*json", sort=True, sort_type="time"
+        metadata_dir, ".*json$", sort=True, sort_type="time"
     )
     if cfg.EVO.IS_EVO and "aging" in cfg.EVO.TOURNAMENT_TYPE:
         metadata_paths = metadata_paths[-cfg.EVO.AGING_WINDOW_SIZE :]
     return metadata_paths
 
+
+"""Lineage index."""
+
+LINEAGE_INDEX = "lineage"
+
+
+def record_lineage(id_, parent_id, root_id, base_dir=None):
+    """Append unimal to lineage index, called when its metadata is saved."""
+    if base_dir is None:
+        base_dir = cfg.OUT_DIR
+    index_dir = os.path.join(base_dir, LINEAGE_INDEX)
+    os.makedirs(index_dir, exist_ok=True)
+    # Shard per proc, appends from different nodes are not atomic over NFS
+    shard = os.path.join(
+        index_dir, "{}-{}.jsonl".format(cfg.NODE_ID, os.getpid())
+    )
+    line = json.dumps({"id": id_, "parent": parent_id, "root": root_id})
+    with open(shard, "a") as f:
+        f.write(line + "\n")
+
+
+class LineageIndex:
+    """Parent pointers and root ancestor of unimals.
+
+    ancestor and same_family are O(1), descendants is O(subtree) and
+    families is linear in num of unimals.
+    """
+
+    def __init__(self):
+        self.parent = {}
+        self.root = {}
+        self.children = defaultdict(list)
+
+    def add(self, id_, parent_id, root_id=None):
+        if root_id is None:
+            root_id = self.root[parent_id] if parent_id else id_
+        self.parent[id_] = parent_id
+        self.root[id_] = root_id
+        if parent_id:
+            self.children[parent_id].append(id_)
+
+    @classmethod
+    def load(cls, base_dir=None, backfill=True):
+        """Load index of a run, backfill from metadata for older runs."""
+        if base_dir is None:
+            base_dir = cfg.OUT_DIR
+        index = cls()
+        index_dir = os.path.join(base_dir, LINEAGE_INDEX)
+        if os.path.isdir(index_dir):
+            for path in fu.get_files(index_dir, ".*jsonl$", sort=True):
+                with open(path, "r") as f:
+                    for line in f:
+                        try:
+                            entry = json.loads(line)
+                        except ValueError:
+                            # Empty or partially written line
+                            continue
+                        index.add(entry["id"], entry["parent"], entry["root"])
+        elif backfill:
+            metadata_dir = os.path.join(base_dir, "metadata")
+            for metadata_path in fu.get_files(metadata_dir, ".*json$"):
+                lineage = fu.load_json(metadata_path)["lineage"].split("/")
+                parent_id = lineage[-2] if len(lineage) > 1 else ""
+                index.add(lineage[-1], parent_id, lineage[0])
+        return index
+
+    def __contains__(self, id_):
+        return id_ in self.root
+
+    def ancestor(self, id_):
+        return self.root[id_]
+
+    def same_family(self, id1, id2):
+        return self.root[id1] == self.root[id2]
+
+    def descendants(self, id_):
+        """All unimals in the subtree of id_ (excluding id_)."""
+        descendants = []
+        stack = list(self.children.get(id_, []))
+        while stack:
+            child = stack.pop()
+            descendants.append(child)
+            stack.extend(self.children.get(child, []))
+        return descendants
+
+    def families(self, ids=None):
+        """Return {root ancestor: [ids]}."""
+        if ids is None:
+            ids = self.root.keys()
+        families = defaultdict(list)
+        for id_ in ids:
+            families[self.root[id_]].append(id_)
+        return families
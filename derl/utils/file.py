@@ -1,13 +1,15 @@
+import contextlib
+import hashlib
 import json
 import math
 import os
 import pickle
 import re
 
+import numpy as np
 import yaml
 
 from derl.config import cfg
-from derl.utils import xml as xu
 
 
 def get_base_dir(docker=False):
@@ -30,8 +32,28 @@ def get_files(_dir, reg_str, sort=False, sort_type=None):
     return list_
 
 
+def get_tmp_path(path):
+    """Hidden temp path next to path, not matched by listings of the folder."""
+    _dir, name = os.path.split(path)
+    return os.path.join(_dir, ".{}.tmp{}".format(name, os.getpid()))
+
+
+@contextlib.contextmanager
+def atomic_open(path, mode="w"):
+    """Yields a temp file which replaces path only once fully written."""
+    tmp_path = get_tmp_path(path)
+    try:
+        with open(tmp_path, mode) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    finally:
+        remove_file(tmp_path)
+
+
 def save_json(data, path):
-    with open(path, "w") as f:
+    with atomic_open(path, "w") as f:
         json.dump(data, f, indent=2)
 
 
@@ -41,13 +63,91 @@ def load_json(path):
 
 
 def save_pickle(data, path):
-    with open(path, "wb") as f:
-        pickle.dump(data, f)
+    save_bytes(pickle.dumps(data), path)
 
 
 def load_pickle(path):
+    return pickle.loads(load_bytes(path))
+
+
+"""Content addressed blob store.
+
+Artifacts in BLOB_SUBFOLDERS are stored once per unique content in
+<base_dir>/blobs and the usual id path (see id2path) is a hard link to the
+blob. So all existing path based readers and directory listings work as is,
+while identical artifacts of near identical unimals share storage. Blobs are
+never modified, artifacts are replaced by re-linking and gc_blobs removes
+blobs no path links to anymore.
+
+Only xml is stored as blobs, models and unimal_init embed per unimal state
+(weights, xml_path) and never dedup. Note that a linked path has the mtime of
+the blob, i.e. of the first identical artifact.
+"""
+
+BLOBS = "blobs"
+
+BLOB_SUBFOLDERS = ("xml",)
+
+
+def save_bytes(data, path):
+    """Atomically write data to path, via the blob store if enabled."""
+    subfolder_dir = os.path.dirname(os.path.abspath(path))
+    subfolder = os.path.basename(subfolder_dir)
+    if subfolder not in BLOB_SUBFOLDERS or not cfg.EVO.BLOB_STORE:
+        with atomic_open(path, "wb") as f:
+            f.write(data)
+        return
+
+    blob_dir = os.path.join(os.path.dirname(subfolder_dir), BLOBS)
+    save_blob(data, path, blob_dir)
+
+
+def load_bytes(path):
     with open(path, "rb") as f:
-        return pickle.load(f)
+        return f.read()
+
+
+def save_blob(data, path, blob_dir):
+    """Store data in blob_dir keyed by its hash and hard link path to it."""
+    digest = hashlib.sha256(data).hexdigest()
+    blob_path = os.path.join(blob_dir, digest[:2], digest)
+
+    if not os.path.exists(blob_path):
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        with atomic_open(blob_path, "wb") as f:
+            f.write(data)
+
+    tmp_path = get_tmp_path(path)
+    remove_file(tmp_path)
+    try:
+        os.link(blob_path, tmp_path)
+        os.replace(tmp_path, path)
+    except OSError:
+        # File system without hard links (or blob removed by a concurrent
+        # gc_blobs), store a private copy
+        remove_file(tmp_path)
+        with atomic_open(path, "wb") as f:
+            f.write(data)
+
+
+def gc_blobs(base_dir=None):
+    """Remove blobs which no artifact links to, returns num removed."""
+    if base_dir is None:
+        base_dir = cfg.OUT_DIR
+    blob_dir = os.path.join(base_dir, BLOBS)
+    if not os.path.isdir(blob_dir):
+        return 0
+
+    num_removed = 0
+    for prefix in os.listdir(blob_dir):
+        prefix_dir = os.path.join(blob_dir, prefix)
+        for name in os.listdir(prefix_dir):
+            blob_path = os.path.join(prefix_dir, name)
+            # Hidden names are blobs being written
+            if not name.startswith(".") and os.stat(blob_path).st_nlink == 1:
+                remove_file(blob_path)
+                num_removed += 1
+    return num_removed
 
 
 def load_yaml(path):
@@ -79,6 +179,104 @@ def get_subfolder(name):
     return os.path.join(cfg.OUT_DIR, name)
 
 
+"""Columnar reward history store.
+
+Alternative to one rewards/*.json per unimal. Each process appends the
+curves of finished unimals to its own shard in OUT_DIR/reward_history: a raw
+float32 file with all values and a jsonl index with the offset and length of
+each column. The index row is written after the values, so a row is only
+visible once its data is complete. Values are read via np.memmap.
+"""
+
+REWARD_HISTORY = "reward_history"
+
+
+def _reward_history_columns(stats):
+    columns = {
+        "rewards/{}".format(rew_type): rews
+        for rew_type, rews in stats["rewards"].items()
+    }
+    for key in ["pos", "vel", "metric"]:
+        columns[key] = stats[key]
+    return columns
+
+
+def append_reward_history(id_, stats, base_dir=None):
+    """Append reward stats (see PPO.reward_stats) of unimal id_."""
+    if base_dir is None:
+        base_dir = cfg.OUT_DIR
+    store_dir = os.path.join(base_dir, REWARD_HISTORY)
+    os.makedirs(store_dir, exist_ok=True)
+    shard = os.path.join(store_dir, "{}-{}".format(cfg.NODE_ID, os.getpid()))
+
+    index_row = {"id": id_, "fps": stats["fps"], "columns": {}}
+    with open(shard + ".f32", "ab") as f:
+        offset = f.tell() // 4
+        for name, values in _reward_history_columns(stats).items():
+            values = np.asarray(values, dtype=np.float32)
+            f.write(values.tobytes())
+            index_row["columns"][name] = [offset, len(values)]
+            offset += len(values)
+        f.flush()
+        os.fsync(f.fileno())
+
+    with open(shard + ".jsonl", "a") as f:
+        f.write(json.dumps(index_row) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def load_reward_history(base_dir=None):
+    """Returns {id: {"fps": fps, column: values}}, values are memmap views.
+
+    Columns are "rewards/<rew_type>", "pos", "vel" and "metric".
+    """
+    if base_dir is None:
+        base_dir = cfg.OUT_DIR
+    store_dir = os.path.join(base_dir, REWARD_HISTORY)
+    if not os.path.isdir(store_dir):
+        return {}
+
+    history = {}
+    for index_path in get_files(store_dir, ".*jsonl$", sort=True):
+        data_path = index_path[: -len(".jsonl")] + ".f32"
+        # Read the index before mapping the data, writers append data first
+        # so every indexed row is within the mapped data unless truncated.
+        rows = []
+        with open(index_path, "r") as f:
+            for line in f:
+                try:
+                    rows.append(json.loads(line))
+                except ValueError:
+                    # Partially written last row
+                    continue
+        if not rows or os.path.getsize(data_path) == 0:
+            continue
+
+        values = np.memmap(data_path, dtype=np.float32, mode="r")
+        for row in rows:
+            columns = row["columns"]
+            end = max(
+                (offset + length for offset, length in columns.values()),
+                default=0,
+            )
+            if end > len(values):
+                # Data of the row is missing (truncated data file)
+                continue
+            curves = {"fps": row["fps"]}
+            for name, (offset, length) in columns.items():
+                curves[name] = values[offset : offset + length]
+            history[row["id"]] = curves
+    return history
+
+
+def load_reward_curves(column, base_dir=None):
+    """Returns ids and the column curve of each unimal in the store."""
+    history = load_reward_history(base_dir=base_dir)
+    ids = sorted(id_ for id_, curves in history.items() if column in curves)
+    return ids, [history[id_][column] for id_ in ids]
+
+
 def get_taskdir(sweep_name, task_num, docker=False):
     base_dir = get_base_dir(docker)
     task_folder = os.path.join(base_dir, sweep_name, "tasks")
@@ -92,7 +290,7 @@ def get_taskdir(sweep_name, task_num, docker=False):
 
 
 def id2path(id_, subfolder, base_dir=None, sweep_name=None, task_num=1):
-    if subfolder == "models":
+    if subfolder == "models" or subfolder == "checkpoints":
         ext = "pt"
     elif subfolder == "metadata" or subfolder == "error_metadata":
         ext = "json"
@@ -67,3 +67,49 @@ def normalize_vec(a):
     """Return unit vector in dir of a."""
     return a / np.linalg.norm(a)
 
+
+def min_dist(a, b):
+    """Min euclidean distance between any point in a (N, 3) and b (M, 3)."""
+    diff = a[:, None, :] - b[None, :, :]
+    return np.sqrt(np.einsum("ijk,ijk->ij", diff, diff).min())
+
+
+def segment_dists(p1, q1, p2, q2, eps=1e-12):
+    """Min distance between segments p1 -> q1 and p2 -> q2.
+
+    All inputs are (N, 3), row i of the output is the distance for the i-th
+    pair of segments. Degenerate segments (p == q) are treated as points.
+    Refer: Real-Time Collision Detection, Ericson, Sec 5.1.9.
+    """
+    d1 = q1 - p1
+    d2 = q2 - p2
+    r = p1 - p2
+    a = np.einsum("ij,ij->i", d1, d1)
+    e = np.einsum("ij,ij->i", d2, d2)
+    b = np.einsum("ij,ij->i", d1, d2)
+    c = np.einsum("ij,ij->i", d1, r)
+    f = np.einsum("ij,ij->i", d2, r)
+
+    deg_a = a <= eps
+    deg_e = e <= eps
+    safe_a = np.where(deg_a, 1.0, a)
+    safe_e = np.where(deg_e, 1.0, e)
+    denom = a * e - b * b
+    is_parallel = denom <= eps
+    safe_denom = np.where(is_parallel, 1.0, denom)
+
+    # General case, closest points of the infinite lines clamped to segments
+    s = np.where(is_parallel, 0.0, np.clip((b * f - c * e) / safe_denom, 0, 1))
+    t = (b * s + f) / safe_e
+    s = np.where(t < 0, np.clip(-c / safe_a, 0, 1), s)
+    s = np.where(t > 1, np.clip((b - c) / safe_a, 0, 1), s)
+    t = np.clip(t, 0, 1)
+
+    # Either segment degenerates into a point
+    s = np.where(deg_e, np.clip(-c / safe_a, 0, 1), s)
+    t = np.where(deg_e, 0.0, t)
+    s = np.where(deg_a, 0.0, s)
+    t = np.where(deg_a, np.where(deg_e, 0.0, np.clip(f / safe_e, 0, 1)), t)
+
+    diff = (p1 + d1 * s[:, None]) - (p2 + d2 * t[:, None])
+    return np.linalg.norm(diff, axis=1)
@@ -1,10 +1,168 @@
 import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
+import numpy as np
 from lxml import etree
 from mujoco_py import MjSim
+from mujoco_py import MjSimPool
 from mujoco_py import load_model_from_xml
 
 
+# Sites which describe the agent (limb ends, limb mid points and torso)
+AGENT_SITE_PREFIXES = ["limb/btm/", "limb/mid/", "torso"]
+
+# Geom name prefixes of the groups supported by contact queries. Walls are
+# matched by substring, see SimHandles.
+GEOM_GROUP_PREFIXES = {
+    "agent": ["torso/", "limb/"],
+    "floor": ["floor/"],
+    "object": ["box/", "ball/", "obstacle/"],
+}
+
+
+class SimHandles:
+    """Registry of ids for elems accessed every step, resolved once per sim.
+
+    Name based accessors like sim.data.get_body_xpos hash the name on every
+    call. Properties here index sim.data directly and return views wherever
+    a single elem is accessed.
+    """
+
+    def __init__(self, sim):
+        self.sim = sim
+        self._ids = {}
+
+        self.torso_id = self.id("body", "torso/0")
+        self.agent_site_ids = np.array(
+            [
+                self.id("site", name)
+                for name in names_from_prefixes(
+                    sim, AGENT_SITE_PREFIXES, "site"
+                )
+            ],
+            dtype=int,
+        )
+
+        # Boolean mask over all geom ids for each geom group
+        geom_names = [name or "" for name in sim.model.geom_names]
+        self.geom_masks = {
+            group: np.array(
+                [name.startswith(tuple(prefixes)) for name in geom_names],
+                dtype=bool,
+            )
+            for group, prefixes in GEOM_GROUP_PREFIXES.items()
+        }
+        self.geom_masks["wall"] = np.array(
+            ["wall" in name for name in geom_names], dtype=bool
+        )
+
+    def id(self, type_, name):
+        """Returns the (cached) mujoco id corresponding to name."""
+        key = (type_, name)
+        if key not in self._ids:
+            self._ids[key] = mj_name2id(self.sim, type_, name)
+        return self._ids[key]
+
+    @property
+    def torso_xpos(self):
+        return self.sim.data.body_xpos[self.torso_id]
+
+    @property
+    def torso_xmat(self):
+        return self.sim.data.body_xmat[self.torso_id].reshape(3, 3)
+
+    @property
+    def agent_site_xpos(self):
+        return self.sim.data.site_xpos[self.agent_site_ids]
+
+    def body_xpos(self, name):
+        return self.sim.data.body_xpos[self.id("body", name)]
+
+    def site_xpos(self, name):
+        return self.sim.data.site_xpos[self.id("site", name)]
+
+    def contact_mask(self, group1, group2=None):
+        """Mask over active contacts between geoms of group1 and group2.
+
+        If group2 is None, contacts between group1 and any geom are selected.
+        """
+        geoms = contact_geom_ids(self.sim)
+        mask1 = self.geom_masks[group1]
+        if group2 is None:
+            return mask1[geoms[:, 0]] | mask1[geoms[:, 1]]
+
+        mask2 = self.geom_masks[group2]
+        return (mask1[geoms[:, 0]] & mask2[geoms[:, 1]]) | (
+            mask2[geoms[:, 0]] & mask1[geoms[:, 1]]
+        )
+
+    def has_contact(self, group1, group2=None):
+        return bool(np.any(self.contact_mask(group1, group2)))
+
+    def contact_count(self, group1, group2=None):
+        """Number of active contacts, useful for reward shaping."""
+        return int(np.count_nonzero(self.contact_mask(group1, group2)))
+
+
+class SimBatch:
+    """Steps the sims of several envs together in one MjSimPool call.
+
+    Each env step runs in its own thread till UnimalEnv.do_simulation, which
+    sets the controls and waits for the other envs. Once all envs have set
+    their controls the sims are advanced frame_skip steps in parallel
+    (MjSimPool releases the GIL), after which every env computes its obs and
+    reward as usual. Every env step must call do_simulation exactly once.
+    """
+
+    def __init__(self, envs):
+        self.envs = [env.unwrapped for env in envs]
+        self.barrier = threading.Barrier(len(envs), action=self._step_sims)
+        self.executor = ThreadPoolExecutor(max_workers=len(envs))
+        self.warned = {}
+        for env in self.envs:
+            env.sim_batch = self
+
+    def _step_sims(self):
+        sims = [env.sim for env in self.envs]
+        # MjSimPool does not raise on MuJoCo warnings like MjSim.step does,
+        # so check the warning counters instead.
+        num_warnings = [_num_warnings(sim) for sim in sims]
+        MjSimPool(sims, nsubsteps=self.envs[0].frame_skip).step()
+        self.warned = {
+            id(env): _num_warnings(sim) > count
+            for env, sim, count in zip(self.envs, sims, num_warnings)
+        }
+
+    def wait(self, env):
+        """Blocks till all sims are stepped, returns True if env's sim warned."""
+        self.barrier.wait()
+        return self.warned[id(env)]
+
+    def map(self, func, envs, args):
+        """Returns [func(env, arg)], all calls run concurrently."""
+        futures = [
+            self.executor.submit(self._call, func, env, arg)
+            for env, arg in zip(envs, args)
+        ]
+        return [future.result() for future in futures]
+
+    def _call(self, func, env, arg):
+        try:
+            return func(env, arg)
+        except BaseException:
+            # Don't leave the other envs waiting on the barrier
+            self.barrier.abort()
+            raise
+
+    def close(self):
+        self.executor.shutdown()
+
+
+def _num_warnings(sim):
+    return sum(warning.number for warning in sim.data.warning)
+
+
 def mj_name2id(sim, type_, name):
     """Returns the mujoco id corresponding to name."""
     if type_ == "site":
@@ -108,18 +266,34 @@ def names_from_prefixes(sim, prefixes, elem_type):
     return matches
 
 
-def get_active_contacts(sim):
+def contact_geom_ids(sim):
+    """Returns (ncon, 2) array of geom ids of the active contacts."""
     num_contacts = sim.data.ncon
     contacts = sim.data.contact[:num_contacts]
+    # mujoco_py exposes the contact buffer as wrapper objects, read the ids
+    # in a single pass.
+    geom_ids = np.fromiter(
+        itertools.chain.from_iterable(
+            (contact.geom1, contact.geom2) for contact in contacts
+        ),
+        dtype=int,
+        count=2 * num_contacts,
+    )
+    return geom_ids.reshape(num_contacts, 2)
+
+
+def get_active_contacts(sim):
+    # Dedup on ids so that only unique pairs are mapped to names
+    geom_pairs = np.unique(np.sort(contact_geom_ids(sim), axis=1), axis=0)
     contact_geoms = [
         tuple(
             sorted(
                 (
-                    mj_id2name(sim, "geom", contact.geom1),
-                    mj_id2name(sim, "geom", contact.geom2),
+                    mj_id2name(sim, "geom", int(geom1)),
+                    mj_id2name(sim, "geom", int(geom2)),
                 )
             )
         )
-        for contact in contacts
+        for geom1, geom2 in geom_pairs
     ]
     return sorted(list(set(contact_geoms)))
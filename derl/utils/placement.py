@@ -3,7 +3,34 @@ import numpy as np
 from derl.config import cfg
 
 
-def uniform_placement(grid, obj_size, random_state):
+def summed_area_table(grid):
+    """Zero padded integral image, sat[i, j] = grid[:i, :j].sum()."""
+    sat = np.zeros((grid.shape[0] + 1, grid.shape[1] + 1))
+    np.cumsum(grid, axis=0, out=sat[1:, 1:])
+    np.cumsum(sat[1:, 1:], axis=1, out=sat[1:, 1:])
+    return sat
+
+
+def free_centers(sat, obj_size, bounds):
+    """Indices in bounds whose obj_size window in the grid is unoccupied."""
+    row_min, row_max, col_min, col_max = bounds
+    nrow, ncol = sat.shape[0] - 1, sat.shape[1] - 1
+    rows = np.arange(row_min, row_max)
+    cols = np.arange(col_min, col_max)
+    top = np.clip(rows - obj_size[1], 0, nrow)
+    btm = np.clip(rows + obj_size[1], 0, nrow)
+    left = np.clip(cols - obj_size[0], 0, ncol)
+    right = np.clip(cols + obj_size[0], 0, ncol)
+    occupied = (
+        sat[np.ix_(btm, right)]
+        - sat[np.ix_(top, right)]
+        - sat[np.ix_(btm, left)]
+        + sat[np.ix_(top, left)]
+    )
+    return np.argwhere(occupied == 0) + [row_min, col_min]
+
+
+def uniform_bounds(grid, obj_size):
     nrow, ncol = grid.shape
     buffer_l = cfg.OBJECT.PLACEMENT_BUFFER_LEN * cfg.HFIELD.NUM_DIVS * 2
     buffer_w = cfg.OBJECT.PLACEMENT_BUFFER_WIDTH * cfg.HFIELD.NUM_DIVS * 2
@@ -13,6 +40,11 @@ def uniform_placement(grid, obj_size, random_state):
 
     row_min = obj_size[1] + buffer_w
     col_min = obj_size[0] + buffer_l
+    return row_min, row_max, col_min, col_max
+
+
+def uniform_placement(grid, obj_size, random_state):
+    row_min, row_max, col_min, col_max = uniform_bounds(grid, obj_size)
     idx = np.array(
         [
             random_state.randint(row_min, row_max),
@@ -22,8 +54,7 @@ def uniform_placement(grid, obj_size, random_state):
     return idx
 
 
-def close_placement(center, grid, obj_size, random_state):
-    # Place a object close to the position specified by center
+def close_bounds(center, grid, obj_size):
     row_c, col_c = center
     nrow, ncol = grid.shape
     buffer_l = cfg.OBJECT.PLACEMENT_BUFFER_LEN * cfg.HFIELD.NUM_DIVS * 2
@@ -38,7 +69,12 @@ def close_placement(center, grid, obj_size, random_state):
     row_max = min(row_lim, row_c + side_len)
     col_min = max(buffer_l, col_c - side_len)
     col_max = min(col_lim, col_c + side_len)
+    return row_min, row_max, col_min, col_max
+
 
+def close_placement(center, grid, obj_size, random_state):
+    # Place a object close to the position specified by center
+    row_min, row_max, col_min, col_max = close_bounds(center, grid, obj_size)
     idx = np.array(
         [
             random_state.randint(row_min, row_max),
@@ -69,38 +105,59 @@ def forward_placement(prev_pos, grid, obj_size, random_state):
     return idx
 
 
+def sample_free(arena, obj_size, bounds, random_state):
+    """Sample uniformly from the free positions in bounds, None if full."""
+    row_min, row_max, col_min, col_max = bounds
+    if row_min >= row_max or col_min >= col_max:
+        return None
+    # The table is rebuilt lazily, only after the grid has been updated
+    if arena.placement_sat is None:
+        arena.placement_sat = summed_area_table(arena.placement_grid)
+    free_idxs = free_centers(arena.placement_sat, obj_size, bounds)
+    if len(free_idxs) == 0:
+        return None
+    return free_idxs[random_state.randint(len(free_idxs))]
+
+
 def place_on_grid(arena, obj_size, center=None, update_grid=True):
     grid = arena.placement_grid
     divs = cfg.HFIELD.NUM_DIVS
     obj_size_in_divs = np.ceil(obj_size * divs).astype(int)
     rnd_state = arena.np_random
 
-    for i in range(10):
-        if cfg.ENV.TASK in ["manipulation"]:
-            row_idx, col_idx = forward_placement(
-                center, grid, obj_size_in_divs, rnd_state
-            )
-        elif center:
-            row_idx, col_idx = close_placement(
-                center, grid, obj_size_in_divs, rnd_state
-            )
-        else:
-            row_idx, col_idx = uniform_placement(
-                grid, obj_size_in_divs, rnd_state
-            )
-
-        if np.any(
-            grid[
-                row_idx - obj_size_in_divs[1] : row_idx + obj_size_in_divs[1],
-                col_idx - obj_size_in_divs[0] : col_idx + obj_size_in_divs[0],
-            ]
-        ):
-            continue
-        else:
-            if update_grid:
-                grid[
-                    row_idx - obj_size_in_divs[1] : row_idx + obj_size_in_divs[1],
-                    col_idx - obj_size_in_divs[0] : col_idx + obj_size_in_divs[0],
-                ] = 1
-            return arena.grid_idx_to_pos(np.asarray([row_idx, col_idx]))
-    return None
+    # First try is a single draw as before, on collision sample directly from
+    # the free positions instead of retrying.
+    if cfg.ENV.TASK in ["manipulation"]:
+        row_idx, col_idx = forward_placement(
+            center, grid, obj_size_in_divs, rnd_state
+        )
+        bounds = uniform_bounds(grid, obj_size_in_divs)[:2] + (
+            col_idx, col_idx + 1
+        )
+    elif center:
+        row_idx, col_idx = close_placement(
+            center, grid, obj_size_in_divs, rnd_state
+        )
+        bounds = close_bounds(center, grid, obj_size_in_divs)
+    else:
+        row_idx, col_idx = uniform_placement(grid, obj_size_in_divs, rnd_state)
+        bounds = uniform_bounds(grid, obj_size_in_divs)
+
+    if np.any(
+        grid[
+            row_idx - obj_size_in_divs[1] : row_idx + obj_size_in_divs[1],
+            col_idx - obj_size_in_divs[0] : col_idx + obj_size_in_divs[0],
+        ]
+    ):
+        idx = sample_free(arena, obj_size_in_divs, bounds, rnd_state)
+        if idx is None:
+            return None
+        row_idx, col_idx = idx
+
+    if update_grid:
+        grid[
+            row_idx - obj_size_in_divs[1] : row_idx + obj_size_in_divs[1],
+            col_idx - obj_size_in_divs[0] : col_idx + obj_size_in_divs[0],
+        ] = 1
+        arena.placement_sat = None
+    return arena.grid_idx_to_pos(np.asarray([row_idx, col_idx]))
@@ -1,3 +1,4 @@
+import functools
 import random
 
 import gym
@@ -23,6 +24,22 @@ def sample_orient(r, step_size=45):
     return [r, theta, phi]
 
 
+@functools.lru_cache(maxsize=256)
+def _range_grid(range_):
+    """Values which can be sampled from range_ (tuple), computed once."""
+    # To make the end point inclusive
+    list_ = np.arange(*range_)
+    list_ = [round(_, 2) for _ in list_]
+    # arange does not handle endpoints nicely for < 1 step size. Add endpoint
+    # manually.
+    list_.append(range_[1])
+    # Same array choice would have created from the list. Shared between
+    # calls, hence read only.
+    grid = np.asarray(list_)
+    grid.setflags(write=False)
+    return grid
+
+
 def sample_from_range(range_, rng_state=None):
     """Randomly sample a value from the list specified by range_."""
 
@@ -31,18 +48,32 @@ def sample_from_range(range_, rng_state=None):
 
     assert len(range_) == 3
 
-    # To make the end point inclusive
-    list_ = np.arange(*range_)
-    list_ = [round(_, 2) for _ in list_]
-    # arange does not handle endpoints nicely for < 1 step size. Add endpoint
-    # manually.
-    list_.append(range_[1])
+    list_ = _range_grid(tuple(range_))
     if rng_state:
         return rng_state.choice(list_, 1)[0]
     else:
         return np.random.choice(list_, 1)[0]
 
 
+def sample_many(range_, num_samples, rng_state=None):
+    """Sample num_samples values from range_ with a single rng call.
+
+    Note: This draws from a different rng stream than num_samples calls to
+    sample_from_range, use only where sequential reproducibility is not
+    required.
+    """
+    if len(range_) == 1:
+        return np.full(num_samples, range_[0])
+
+    assert len(range_) == 3
+
+    list_ = _range_grid(tuple(range_))
+    if rng_state:
+        return rng_state.choice(list_, num_samples)
+    else:
+        return np.random.choice(list_, num_samples)
+
+
 def sample_from_list(list_, rng_state=None):
     """Randomly sample a element of the list."""
     if rng_state:
@@ -51,6 +82,25 @@ def sample_from_list(list_, rng_state=None):
         return np.random.choice(list_, 1)[0]
 
 
+@functools.lru_cache(maxsize=256)
+def _low_grid(range_):
+    """Values low can take in sample_range_from_range."""
+    grid = np.arange(*range_)
+    grid.setflags(write=False)
+    return grid
+
+
+@functools.lru_cache(maxsize=256)
+def _hi_grid(low, hi, step):
+    """Values hi can take for a given low in sample_range_from_range."""
+    list_ = list(np.arange(low, hi, step))
+    list_.append(hi)
+    # low should be removed
+    grid = np.asarray(list_[1:])
+    grid.setflags(write=False)
+    return grid
+
+
 def sample_range_from_range(range_):
     """Randomly sample (low, hi) from the list specified by range_."""
 
@@ -62,13 +112,10 @@ def sample_range_from_range(range_):
 
     while True:
         # For low last endpoint is not included
-        list_ = np.arange(*range_)
+        list_ = _low_grid(tuple(range_))
         low = np.random.choice(list_, 1)[0]
 
-        list_ = list(np.arange(low, range_[1], range_[2]))
-        list_.append(range_[1])
-        # low should be removed
-        list_ = list_[1:]
+        list_ = _hi_grid(low, range_[1], range_[2])
         if len(list_) == 0:
             continue
         hi = np.random.choice(list_, 1)[0]
@@ -1,23 +1,25 @@
+import atexit
 import hashlib
 import itertools
 import multiprocessing
+import os
+from collections import defaultdict
 from multiprocessing import Pool
+from multiprocessing import shared_memory
 
 import networkx as nx
+import numpy as np
 from scipy.optimize import linear_sum_assignment
 from scipy.spatial.distance import cdist
 
+from derl.utils import evo as eu
 from derl.utils import file as fu
 from derl.utils import mjpy as mu
 from derl.utils import xml as xu
 
 
-def point_cloud_from_xml(path):
-    """Create point cloud from unimal xml path."""
-    unimal_id = fu.path2id(path)
-    root, tree = xu.etree_from_xml(path)
-    sim = mu.mjsim_from_etree(root)
-    sim.forward()
+def point_cloud_from_sim(sim):
+    """Create point cloud from sim of unimal."""
     # Get sites which describe the limbs
     site_prefixes = ["limb/btm/", "torso", "limb/mid/"]
     sites = mu.names_from_prefixes(sim, site_prefixes, "site")
@@ -29,15 +31,20 @@ def point_cloud_from_xml(path):
         pos = [x, y, z]
         pos = [round(_, 2) for _ in pos]
         sparse_point_cloud.append(pos)
-    return [unimal_id, sparse_point_cloud]
+    return sparse_point_cloud
 
 
-def geom_orientations_from_xml(path):
-    """Create a list of geom orientations."""
+def point_cloud_from_xml(path):
+    """Create point cloud from unimal xml path."""
     unimal_id = fu.path2id(path)
     root, tree = xu.etree_from_xml(path)
     sim = mu.mjsim_from_etree(root)
     sim.forward()
+    return [unimal_id, point_cloud_from_sim(sim)]
+
+
+def geom_orientations_from_sim(sim):
+    """Create a list of geom orientations from sim of unimal."""
     limbs = mu.names_from_prefixes(sim, ["limb/"], "geom")
 
     limb_orientations = []
@@ -45,13 +52,25 @@ def geom_orientations_from_xml(path):
         geom_frame = sim.data.get_geom_xmat(limb_name).copy().ravel()
         limb_orientations.append(geom_frame)
 
-    return [unimal_id, limb_orientations]
+    return limb_orientations
 
 
-def hash_from_xml(path):
-    """Return hash of the xml file, most narrow form of comparision."""
+def geom_orientations_from_etree(root):
+    """Create a list of geom orientations from unimal etree root."""
+    sim = mu.mjsim_from_etree(root)
+    sim.forward()
+    return geom_orientations_from_sim(sim)
+
+
+def geom_orientations_from_xml(path):
+    """Create a list of geom orientations."""
     unimal_id = fu.path2id(path)
     root, tree = xu.etree_from_xml(path)
+    return [unimal_id, geom_orientations_from_etree(root)]
+
+
+def hash_from_etree(root):
+    """Return hash of unimal etree root. Note: root is modified."""
     contact = root.findall("./contact")[0]
     contact_pairs = xu.find_elem(contact, "exclude")
     for cp in contact_pairs:
@@ -61,7 +80,65 @@ def hash_from_xml(path):
     for asset in assets:
         root.remove(asset)
     xml_string = xu.etree_to_str(root)
-    return [unimal_id, hashlib.sha224(str.encode(xml_string)).hexdigest()]
+    return hashlib.sha224(str.encode(xml_string)).hexdigest()
+
+
+def hash_from_xml(path):
+    """Return hash of the xml file, most narrow form of comparision."""
+    unimal_id = fu.path2id(path)
+    root, tree = xu.etree_from_xml(path)
+    return [unimal_id, hash_from_etree(root)]
+
+
+"""Persistent cache of similarity metrics."""
+
+# Metrics which only depend on the xml content and can be cached
+CACHED_METRICS = ["point_cloud", "geom_orientation", "hash"]
+
+
+def feature_cache_path(xml_path):
+    """Path of cached features of xml, content addressed by xml sha1.
+
+    Cache lives in the features folder next to the xml folder, so that it
+    works for both cfg.OUT_DIR and sweep task dirs.
+    """
+    with open(xml_path, "rb") as f:
+        key = hashlib.sha1(f.read()).hexdigest()
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(xml_path)))
+    return os.path.join(base_dir, "features", "{}.npz".format(key))
+
+
+def save_features(xml_path):
+    """Compute all content based metrics of xml with a single parse."""
+    cache_path = feature_cache_path(xml_path)
+    root, tree = xu.etree_from_xml(xml_path)
+    sim = mu.mjsim_from_etree(root)
+    sim.forward()
+    features = {
+        "point_cloud": np.array(point_cloud_from_sim(sim)),
+        "geom_orientation": np.array(geom_orientations_from_sim(sim)),
+        "hash": np.array(hash_from_etree(root)),
+    }
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    with fu.atomic_open(cache_path, "wb") as f:
+        np.savez(f, **features)
+    return features
+
+
+def load_features(xml_path):
+    """Load cached metrics of xml, computing and caching them if missing."""
+    cache_path = feature_cache_path(xml_path)
+    if not os.path.exists(cache_path):
+        return save_features(xml_path)
+    with np.load(cache_path) as data:
+        return {key: data[key] for key in data.files}
+
+
+def cached_metric_from_xml(path, metric_name):
+    metric = load_features(path)[metric_name]
+    if metric_name == "hash":
+        metric = str(metric)
+    return [fu.path2id(path), metric]
 
 
 def get_ancestor_from_xml(path):
@@ -72,48 +149,311 @@ def get_ancestor_from_xml(path):
     return [unimal_id, metadata["lineage"].split("/")[0]]
 
 
-def get_metric_in_parallel(paths, metric_name):
+"""Worker pool and shared features."""
+
+# Pool shared across calls, see get_pool
+_POOL = None
+_POOL_SIZE = None
+# Num of tasks sent to a worker at once
+CHUNK_SIZE = 256
+
+
+def get_pool(num_procs=None):
+    """Return the module level pool, (re)creating it only if size changes.
+
+    Defaults to half the cores.
+    """
+    global _POOL, _POOL_SIZE
+    if num_procs is None:
+        num_procs = max(1, multiprocessing.cpu_count() // 2)
+    if _POOL is None or _POOL_SIZE != num_procs:
+        close_pool()
+        _POOL = Pool(num_procs)
+        _POOL_SIZE = num_procs
+    return _POOL
+
+
+@atexit.register
+def close_pool():
+    global _POOL, _POOL_SIZE
+    if _POOL is not None:
+        _POOL.close()
+        _POOL.join()
+    _POOL, _POOL_SIZE = None, None
+
+
+class SharedFeatures:
+    """Per unimal metrics (n_i, d) packed in shared memory.
+
+    Workers receive the small spec plus indices instead of pickled metrics.
+    Use as a context manager, the memory is released on exit.
+    """
+
+    def __init__(self, metrics):
+        metrics = [np.asarray(m, dtype=float) for m in metrics]
+        dim = max((m.shape[1] for m in metrics if m.size), default=1)
+        lens = [len(m) for m in metrics]
+        offsets = np.concatenate([[0], np.cumsum(lens)]).astype(np.int64)
+        data = np.concatenate(
+            [m.reshape(-1, dim) for m in metrics] + [np.zeros((0, dim))]
+        )
+
+        self._shms = []
+        data_name = self._to_shm(data)
+        offsets_name = self._to_shm(offsets)
+        self.spec = (data_name, data.shape, offsets_name, offsets.shape)
+
+    def _to_shm(self, arr):
+        shm = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+        np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)[:] = arr
+        self._shms.append(shm)
+        return shm.name
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        for shm in self._shms:
+            shm.close()
+            shm.unlink()
+
+
+# Worker side view of the current SharedFeatures
+_worker_features = {"spec": None, "shms": [], "data": None, "offsets": None}
+
+
+def _attach_features(spec):
+    if _worker_features["spec"] != spec:
+        # Views on the old segments have to be released before closing them
+        _worker_features.update(data=None, offsets=None)
+        for shm in _worker_features["shms"]:
+            shm.close()
+        data_name, data_shape, offsets_name, offsets_shape = spec
+        data_shm = shared_memory.SharedMemory(name=data_name)
+        offsets_shm = shared_memory.SharedMemory(name=offsets_name)
+        _worker_features.update(
+            spec=spec,
+            shms=[data_shm, offsets_shm],
+            data=np.ndarray(data_shape, dtype=float, buffer=data_shm.buf),
+            offsets=np.ndarray(
+                offsets_shape, dtype=np.int64, buffer=offsets_shm.buf
+            ),
+        )
+    return _worker_features["data"], _worker_features["offsets"]
+
+
+def _is_same_idx_pair(args):
+    spec, idx1, idx2 = args
+    data, offsets = _attach_features(spec)
+    m1 = data[offsets[idx1]:offsets[idx1 + 1]]
+    m2 = data[offsets[idx2]:offsets[idx2 + 1]]
+    return idx1, idx2, is_same_morphology(m1, m2)
+
+
+def get_metric_in_parallel(paths, metric_name, num_procs=None):
     """Get similarity metric for a list of unimals."""
-    p = Pool()
-    if metric_name == "point_cloud":
-        data = p.map(point_cloud_from_xml, paths)
-    elif metric_name == "geom_orientation":
-        data = p.map(geom_orientations_from_xml, paths)
+    p = get_pool(num_procs)
+    if metric_name in CACHED_METRICS:
+        data = p.starmap(
+            cached_metric_from_xml,
+            [(path, metric_name) for path in paths],
+            chunksize=CHUNK_SIZE,
+        )
     elif metric_name == "ancestor":
-        data = p.map(get_ancestor_from_xml, paths)
-    elif metric_name == "hash":
-        data = p.map(hash_from_xml, paths)
+        # Lineage is not a function of xml content, read from metadata
+        data = p.map(get_ancestor_from_xml, paths, chunksize=CHUNK_SIZE)
     else:
         raise ValueError("Metric {} not supported.".format(metric_name))
 
-    p.close()
-    p.join()
     return {uid: m for uid, m in data}
 
 
+# Num of random projections of the mean limb metric used as lsh keys
+NUM_LSH_PROJECTIONS = 4
+
+
+def _morphology_eps(m):
+    # Geom orientations (flattened 3x3 frames) vs point clouds
+    if len(m[0]) == 9:
+        return 0.2
+    else:
+        return 1e-3
+
+
 def is_same_morphology(m1, m2):
     """Return True if unimals have same num_limbs and same metric for all limbs."""
     cost = cdist(m1, m2)
     row_ind, col_ind = linear_sum_assignment(cost)
     assignment_cost = cost[row_ind, col_ind].sum()
-    if len(m1[0]) == 9:
-        eps = 0.2
-    else:
-        eps = 1e-3
+    eps = _morphology_eps(m1)
     if assignment_cost < eps and len(m1) == len(m2):
         return True
     else:
         return False
 
 
-def check_all_pair_sim(all_pairs, unimal_m):
-    # Create all pairs metric
-    all_pairs_pc = [[unimal_m[u1], unimal_m[u2]] for u1, u2 in all_pairs]
-    p = Pool(int(multiprocessing.cpu_count() * 0.50))
-    data = p.starmap(is_same_morphology, all_pairs_pc)
-    p.close()
-    p.join()
-    return data
+def canonical_signature(m, decimals=6):
+    """Hashable signature of metric m, invariant to the order of limbs.
+
+    Rows are rounded and sorted, so unimals with the same signature have an
+    assignment cost far below the is_same_morphology eps.
+    """
+    if len(m) == 0:
+        return ()
+    # Adding 0.0 maps -0.0 to 0.0
+    m = np.round(np.asarray(m, dtype=float), decimals) + 0.0
+    m = m[np.lexsort(m.T[::-1])]
+    return m.shape, m.tobytes()
+
+
+def _lsh_projections(dim):
+    # Fixed unit vectors so that keys are comparable across calls
+    proj = np.random.RandomState(dim).randn(dim, NUM_LSH_PROJECTIONS)
+    return proj / np.linalg.norm(proj, axis=0)
+
+
+def _lsh_key(m):
+    """Bucket of the mean limb metric along a few random projections.
+
+    For same morphologies the mean metric differs by less than eps / n
+    (assignment cost is a sum over n limbs), hence so does every projection.
+    With cell width eps / n same morphologies are at most one cell apart.
+    """
+    m = np.asarray(m, dtype=float)
+    width = _morphology_eps(m) / len(m)
+    proj = m.mean(axis=0).dot(_lsh_projections(m.shape[1]))
+    return len(m), tuple(np.floor(proj / width).astype(int))
+
+
+def _signature_groups(unimal_m):
+    """Group uids with the same canonical_signature, in insertion order."""
+    groups = defaultdict(list)
+    for uid, m in unimal_m.items():
+        groups[canonical_signature(m)].append(uid)
+    return list(groups.values())
+
+
+def _lsh_candidate_pairs(unimal_m):
+    """Yield pairs of uids in neighbouring lsh buckets, the earlier uid first.
+
+    Only these pairs can be is_same_morphology.
+    """
+    buckets = defaultdict(list)
+    offsets = list(itertools.product((-1, 0, 1), repeat=NUM_LSH_PROJECTIONS))
+    for uid, m in unimal_m.items():
+        if len(m) == 0:
+            continue
+        num_limbs, cells = _lsh_key(m)
+        for offset in offsets:
+            key = (num_limbs, tuple(c + o for c, o in zip(cells, offset)))
+            for other_uid in buckets.get(key, []):
+                yield other_uid, uid
+        buckets[(num_limbs, cells)].append(uid)
+
+
+def find_same_pairs(unimal_m):
+    """Yield all pairs of uids which are is_same_morphology.
+
+    Exact duplicates are grouped by canonical_signature. Assignment based
+    check is done only between groups in neighbouring lsh buckets, which
+    avoids the quadratic all pairs check.
+    """
+    groups = _signature_groups(unimal_m)
+    for uids in groups:
+        yield from itertools.combinations(uids, 2)
+
+    rep2uids = {uids[0]: uids for uids in groups}
+    reps_m = {rep: unimal_m[rep] for rep in rep2uids}
+    for rep1, rep2 in _lsh_candidate_pairs(reps_m):
+        if is_same_morphology(reps_m[rep1], reps_m[rep2]):
+            yield from itertools.product(rep2uids[rep1], rep2uids[rep2])
+
+
+def find_same_value_pairs(unimal_v):
+    """Yield all pairs of uids which have the same (hashable) value."""
+    groups = defaultdict(list)
+    for uid, value in unimal_v.items():
+        groups[value].append(uid)
+    for uids in groups.values():
+        yield from itertools.combinations(uids, 2)
+
+
+class UnionFind:
+    """Disjoint sets of unimal ids, memory is linear in num of ids."""
+
+    def __init__(self, items=()):
+        self.parent = {}
+        self.size = {}
+        for item in items:
+            self.add(item)
+
+    def add(self, item):
+        if item not in self.parent:
+            self.parent[item] = item
+            self.size[item] = 1
+
+    def find(self, item):
+        root = item
+        while self.parent[root] != root:
+            root = self.parent[root]
+        # Path compression
+        while self.parent[item] != root:
+            self.parent[item], item = root, self.parent[item]
+        return root
+
+    def union(self, item1, item2):
+        """Merge sets of item1 and item2, returns False if already merged."""
+        root1, root2 = self.find(item1), self.find(item2)
+        if root1 == root2:
+            return False
+        if self.size[root1] < self.size[root2]:
+            root1, root2 = root2, root1
+        self.parent[root2] = root1
+        self.size[root1] += self.size[root2]
+        return True
+
+    def same(self, item1, item2):
+        return self.find(item1) == self.find(item2)
+
+    def components(self):
+        """Return list of sets, similar to nx.connected_components."""
+        components = defaultdict(set)
+        for item in self.parent:
+            components[self.find(item)].add(item)
+        return list(components.values())
+
+
+def cluster_pairs(unimal_m, pairs=None, num_procs=None, batch_size=10000):
+    """Cluster unimals by streaming is_same_morphology decisions.
+
+    Candidate pairs (all pairs by default) are consumed lazily in batches.
+    Pairs already in the same component are skipped before being sent to
+    the workers, and results are merged as they arrive.
+    """
+    uids = list(unimal_m.keys())
+    uid2idx = {uid: idx for idx, uid in enumerate(uids)}
+    uf = UnionFind(uids)
+    if pairs is None:
+        pairs = itertools.combinations(uids, 2)
+    pairs = iter(pairs)
+
+    p = get_pool(num_procs)
+    with SharedFeatures([unimal_m[uid] for uid in uids]) as features:
+        while True:
+            batch = list(itertools.islice(pairs, batch_size))
+            if not batch:
+                break
+            batch = [
+                (features.spec, uid2idx[uid1], uid2idx[uid2])
+                for uid1, uid2 in batch
+                if not uf.same(uid1, uid2)
+            ]
+            for idx1, idx2, is_same in p.imap_unordered(
+                _is_same_idx_pair, batch, chunksize=CHUNK_SIZE
+            ):
+                if is_same:
+                    uf.union(uids[idx1], uids[idx2])
+    return uf.components()
 
 
 def check_all_pair_ancestry(all_pairs, unimal_ancestor):
@@ -150,26 +490,48 @@ def create_graph(all_pairs, all_pairs_sim):
     return G
 
 
-def create_graph_from_xml_paths(xml_paths, metric_name, graph_type):
+def ancestors_from_xml_paths(xml_paths, num_procs=None):
+    """Return {uid: root ancestor}, from the lineage index when possible."""
+    if not xml_paths:
+        return {}
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(xml_paths[0])))
+    index = eu.LineageIndex.load(base_dir)
+    uids = [fu.path2id(path) for path in xml_paths]
+    if all(uid in index for uid in uids):
+        return {uid: index.ancestor(uid) for uid in uids}
+    return get_metric_in_parallel(xml_paths, "ancestor", num_procs=num_procs)
+
+
+def same_pairs_from_xml_paths(xml_paths, metric_name, graph_type):
+    """Return uids and an iterator over pairs of uids which are same."""
     # Create dict {uid: point_cloud}
     unimal_m = get_metric_in_parallel(xml_paths, metric_name)
-    # Create list of all unimal pairing
-    all_pairs = list(itertools.combinations(unimal_m.keys(), 2))
 
     if graph_type == "individual":
-        all_pairs_sim = check_all_pair_same_individual(all_pairs, unimal_m)
-        return create_graph(all_pairs, all_pairs_sim)
+        same_pairs = find_same_value_pairs(unimal_m)
+    else:
+        # Check if two unimals have the same morphology
+        same_pairs = find_same_pairs(unimal_m)
 
-    # Check if two unimals have the same morphology
-    all_pairs_sim = check_all_pair_sim(all_pairs, unimal_m)
     if graph_type == "family":
-        unimal_ancestor = get_metric_in_parallel(xml_paths, "ancestor")
-        all_pairs_sim_a = check_all_pair_ancestry(all_pairs, unimal_ancestor)
-        all_pairs_sim = [
-            s1 or s2 for s1, s2 in zip(all_pairs_sim, all_pairs_sim_a)
-        ]
+        unimal_ancestor = ancestors_from_xml_paths(xml_paths)
+        same_pairs = itertools.chain(
+            same_pairs, find_same_value_pairs(unimal_ancestor)
+        )
 
-    return create_graph(all_pairs, all_pairs_sim)
+    return list(unimal_m.keys()), same_pairs
+
+
+def create_graph_from_xml_paths(xml_paths, metric_name, graph_type):
+    uids, same_pairs = same_pairs_from_xml_paths(
+        xml_paths, metric_name, graph_type
+    )
+    # Create graph with nodes as unimal ids and edges between
+    # them if they have the same morphology
+    G = nx.Graph()
+    G.add_nodes_from(uids)
+    G.add_edges_from(same_pairs)
+    return G
 
 
 def create_graph_from_uids(
@@ -180,3 +542,55 @@ def create_graph_from_uids(
         for uid in uids
     ]
     return create_graph_from_xml_paths(xml_paths, metric_name, graph_type)
+
+
+def components_from_uids(
+    sweep_name,
+    uids,
+    metric_name,
+    graph_type="species",
+    task_num=1,
+    num_procs=None,
+):
+    """Same as nx.connected_components of create_graph_from_uids.
+
+    Uses union-find, so neither the graph nor the pairs are materialized.
+    Exact duplicates are merged directly, the lsh candidate pairs between
+    their representatives are checked by the workers via cluster_pairs.
+    Families are merged via their root ancestor in linear time.
+    """
+    xml_paths = [
+        fu.id2path(uid, "xml", sweep_name=sweep_name, task_num=task_num)
+        for uid in uids
+    ]
+    unimal_m = get_metric_in_parallel(
+        xml_paths, metric_name, num_procs=num_procs
+    )
+    uf = UnionFind(unimal_m.keys())
+
+    if graph_type == "individual":
+        for uid1, uid2 in find_same_value_pairs(unimal_m):
+            uf.union(uid1, uid2)
+        return uf.components()
+
+    groups = _signature_groups(unimal_m)
+    for uids in groups:
+        for uid in uids[1:]:
+            uf.union(uids[0], uid)
+    reps_m = {uids[0]: unimal_m[uids[0]] for uids in groups}
+    components = cluster_pairs(
+        reps_m, pairs=_lsh_candidate_pairs(reps_m), num_procs=num_procs
+    )
+    for component in components:
+        first = next(iter(component))
+        for uid in component:
+            uf.union(first, uid)
+
+    if graph_type == "family":
+        unimal_ancestor = ancestors_from_xml_paths(
+            xml_paths, num_procs=num_procs
+        )
+        first_of_family = {}
+        for uid, ancestor in unimal_ancestor.items():
+            uf.union(uid, first_of_family.setdefault(ancestor, uid))
+    return uf.components()
@@ -1,6 +1,12 @@
+import copy
+import functools
+import os
+
 import numpy as np
 from lxml import etree
 
+from derl.utils import file as fu
+
 
 def arr2str(array, num_decimals=-1):
     """Converts a numeric array into the string format in mujoco.
@@ -55,14 +61,17 @@ def axis2arr(axis):
 
 def save_etree_as_xml(tree, path):
     """Save etree.ElementTree as xml file."""
-    tree.write(
-        path, xml_declaration=True, encoding="utf-8", pretty_print=True,
-    )
-    # Horrible!!! But this ensures that saved xml is always pretty
-    root, tree = etree_from_xml(path)
-    tree.write(
-        path, xml_declaration=True, encoding="utf-8", pretty_print=True,
+    # Re-parse without blank text in memory, this ensures that saved xml is
+    # always pretty.
+    parser = etree.XMLParser(remove_blank_text=True)
+    root = etree.fromstring(etree.tostring(tree, encoding="utf-8"), parser)
+    xml_str = etree.tostring(
+        root.getroottree(),
+        xml_declaration=True,
+        encoding="utf-8",
+        pretty_print=True,
     )
+    fu.save_bytes(xml_str, path)
 
 
 def etree_from_xml(xml, ispath=True):
@@ -76,6 +85,32 @@ def etree_from_xml(xml, ispath=True):
     return root, tree
 
 
+def copy_etree(root):
+    """Deep copy etree root and return root and tree."""
+    root = copy.deepcopy(root)
+    tree = etree.ElementTree(root)
+    return root, tree
+
+
+@functools.lru_cache(maxsize=64)
+def _parse_xml(path, mtime_ns):
+    # mtime_ns is only part of the cache key, so that rewritten files are
+    # parsed again.
+    root, _ = etree_from_xml(path)
+    return root
+
+
+def etree_from_cached_xml(path):
+    """Load xml as etree using a per process cache of parsed files.
+
+    The cached etree is never handed out, every call returns a deep copy
+    which the caller is free to modify.
+    """
+    path = os.path.abspath(path)
+    root = _parse_xml(path, os.stat(path).st_mtime_ns)
+    return copy_etree(root)
+
+
 def etree_to_str(elem):
     """Convert etree elem to string."""
     return etree.tostring(elem, encoding="unicode", pretty_print=True)
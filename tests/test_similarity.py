@@ -0,0 +1,31 @@
+import numpy as np
+
+from derl.utils import similarity as simu
+
+
+def _unimal_m():
+    rng = np.random.RandomState(0)
+    orients = rng.rand(3, 9)
+    return {
+        "a": orients,
+        # Same morphology, limbs in a different order
+        "b": orients[::-1].copy(),
+        "c": rng.rand(3, 9),
+        "d": rng.rand(4, 9),
+    }
+
+
+def _sorted_components(components):
+    return sorted(sorted(component) for component in components)
+
+
+def test_cluster_pairs_reuses_pool():
+    # Single worker, so the second call re-attaches the features of the
+    # worker which handled the first call.
+    expected = [["a", "b"], ["c"], ["d"]]
+    try:
+        for _ in range(2):
+            components = simu.cluster_pairs(_unimal_m(), num_procs=1)
+            assert _sorted_components(components) == expected
+    finally:
+        simu.close_pool()
@@ -0,0 +1,294 @@
+"""Micro benchmarks for env hot paths.
+
+Example:
+    python tools/benchmark_env.py --cfg configs/evo/ft.yml --bench obs \
+        PPO.XML_PATH ./output/ft/xml/0-1-01-00-00-00.xml
+
+    python tools/benchmark_env.py --cfg configs/evo/vt.yml --bench terrain \
+        --num-iters 100 TERRAIN.SIZE "[75, 75, 1]" HFIELD.NUM_DIVS 10
+
+    python tools/benchmark_env.py --cfg configs/evo/vt.yml --bench compiled
+
+    python tools/benchmark_env.py --cfg configs/evo/ft.yml --bench fidelity \
+        --num-iters 1000 PPO.XML_PATH ./output/ft/xml/0-1-01-00-00-00.xml
+"""
+
+import argparse
+import sys
+import time
+
+import numpy as np
+from lxml import etree
+
+import derl.utils.xml as xu
+from derl.algos.ppo.envs import make_env
+from derl.config import FIDELITY_PRESETS
+from derl.config import cfg
+from derl.envs.modules.agent import merge_agent_with_base
+from derl.envs.modules.terrain import Terrain
+from derl.envs.tasks.task import modify_xml_attributes
+from derl.envs.wrappers.compiled import CompiledEnv
+
+
+def parse_args():
+    """Parses the arguments."""
+    parser = argparse.ArgumentParser(description="Benchmark env hot paths.")
+    parser.add_argument(
+        "--cfg", dest="cfg_file", help="Config file", required=True, type=str
+    )
+    parser.add_argument(
+        "--bench", default="obs", type=str, help="Benchmark to run"
+    )
+    parser.add_argument("--num-iters", default=10000, type=int)
+    parser.add_argument(
+        "opts", default=None, nargs=argparse.REMAINDER,
+    )
+    if len(sys.argv) == 1:
+        parser.print_help()
+        sys.exit(1)
+    return parser.parse_args()
+
+
+def timeit(func, num_iters):
+    """Returns mean time per call of func in micro seconds."""
+    start = time.perf_counter()
+    for _ in range(num_iters):
+        func()
+    return (time.perf_counter() - start) / num_iters * 1e6
+
+
+def build_env():
+    xml_file = cfg.PPO.XML_PATH if cfg.PPO.XML_PATH else None
+    env = make_env(cfg.ENV_NAME, cfg.RNG_SEED, 0, xml_file=xml_file)()
+    env.reset()
+    return env
+
+
+def bench_obs(num_iters):
+    """Per step latency of proprioceptive obs extraction."""
+    env = build_env()
+    unwrapped = env.unwrapped
+    agent = unwrapped.modules["Agent"]
+    num_limbs = len(agent.limb_btm_sites)
+    obs_time = timeit(
+        lambda: agent.observation_step(unwrapped, unwrapped.sim), num_iters
+    )
+    print(
+        "Agent.observation_step ({} limbs): {:.2f} us".format(
+            num_limbs, obs_time
+        )
+    )
+
+
+def bench_step(num_iters):
+    """Per step latency of the full wrapped env."""
+    env = build_env()
+    action = np.zeros(env.action_space.shape)
+
+    def _step():
+        _, _, done, _ = env.step(action)
+        if done:
+            env.reset()
+
+    print("env.step: {:.2f} us".format(timeit(_step, num_iters)))
+
+
+def _legacy_xml_str(xml_path):
+    """Env xml assembled the legacy way, every stage re-parses a string."""
+    # extract_agent_from_xml
+    agent_str = xu.etree_to_str(xu.etree_from_xml(xml_path)[0])
+    agent_root, _ = xu.etree_from_xml(agent_str, ispath=False)
+    # Template was parsed per env
+    xu.etree_from_xml(cfg.UNIMAL_TEMPLATE)
+    xml_str = xu.etree_to_str(merge_agent_with_base(agent_root))
+    # modify_xml_attributes
+    root, _ = xu.etree_from_xml(xml_str, ispath=False)
+    xml_str = xu.etree_to_str(modify_xml_attributes(root))
+    # UnimalEnv._get_sim
+    root, _ = xu.etree_from_xml(xml_str, ispath=False)
+    return xu.etree_to_str(root)
+
+
+def _cached_xml_str(xml_path):
+    """Env xml assembled as in make_env, a single (cached) etree."""
+    agent_root, _ = xu.etree_from_cached_xml(xml_path)
+    root = modify_xml_attributes(merge_agent_with_base(agent_root))
+    # UnimalEnv._get_sim
+    root, _ = xu.copy_etree(root)
+    return xu.etree_to_str(root)
+
+
+def bench_build(num_iters):
+    """Env construction latency, i.e. xml assembly, compile and first reset.
+
+    Also compares xml assembly of the legacy per call parse path with the
+    cached etree path, checks both produce the same xml.
+    """
+    xml_path = cfg.PPO.XML_PATH if cfg.PPO.XML_PATH else cfg.ENV.WALKER
+    # Re-parsed strings keep indentation, compare ignoring blank text
+    parser = etree.XMLParser(remove_blank_text=True)
+    legacy, cached = [
+        etree.tostring(etree.fromstring(func(xml_path), parser))
+        for func in [_legacy_xml_str, _cached_xml_str]
+    ]
+    assert legacy == cached, "Cached xml assembly differs from legacy"
+
+    funcs = [("legacy", _legacy_xml_str), ("cached", _cached_xml_str)]
+    for name, func in funcs:
+        xml_time = timeit(lambda: func(xml_path), num_iters)
+        print("xml assembly ({}): {:.2f} ms".format(name, xml_time / 1e3))
+
+    num_iters = min(num_iters, cfg.PPO.NUM_ENVS)
+    build_time = timeit(build_env, num_iters)
+    print(
+        "make_env: {:.2f} ms per env, {:.2f} s for {} envs".format(
+            build_time / 1e3,
+            build_time * cfg.PPO.NUM_ENVS / 1e6,
+            cfg.PPO.NUM_ENVS,
+        )
+    )
+
+
+def bench_terrain(num_iters):
+    """Terrain synthesis latency, checks output matches the reference."""
+
+    def _create_scene(seed, reference):
+        terrain = Terrain(random_state=np.random.RandomState(seed))
+        terrain.reference = reference
+        terrain.create_scene()
+        return terrain.hfield
+
+    for seed in range(10):
+        assert np.array_equal(
+            _create_scene(seed, True), _create_scene(seed, False)
+        ), "Terrain differs from reference for seed {}".format(seed)
+
+    for reference in [True, False]:
+        seeds = iter(range(num_iters))
+        terrain_time = timeit(
+            lambda: _create_scene(next(seeds), reference), num_iters
+        )
+        print(
+            "Terrain.create_scene (reference={}, hfield {}): {:.2f} ms".format(
+                reference, _create_scene(0, reference).shape, terrain_time / 1e3
+            )
+        )
+
+
+def assert_identical(x1, x2, name="output"):
+    """Asserts (nested) step outputs are bit identical."""
+    if isinstance(x1, dict):
+        assert x1.keys() == x2.keys(), "Keys of {} differ".format(name)
+        for k in x1:
+            assert_identical(x1[k], x2[k], "{}[{!r}]".format(name, k))
+    elif isinstance(x1, (list, tuple)):
+        assert len(x1) == len(x2), "Length of {} differs".format(name)
+        for idx, (v1, v2) in enumerate(zip(x1, x2)):
+            assert_identical(v1, v2, "{}[{}]".format(name, idx))
+    else:
+        a1, a2 = np.asarray(x1), np.asarray(x2)
+        if a1.dtype == object or a2.dtype == object:
+            same = x1 == x2
+        else:
+            # Compares bytes, so nan outputs are identical too
+            same = (
+                a1.dtype == a2.dtype
+                and a1.shape == a2.shape
+                and a1.tobytes() == a2.tobytes()
+            )
+        assert same, "{} differs: {} vs {}".format(name, x1, x2)
+
+
+def bench_compiled(num_iters):
+    """Per step latency of nested vs compiled wrappers, checks outputs match."""
+
+    def _rollout(env, actions):
+        outputs = []
+        for action in actions:
+            obs, rew, done, info = env.step(action)
+            if "episode" in info:
+                # Wall clock time of the episode is expected to differ
+                episode = {
+                    k: v for k, v in info["episode"].items() if k != "t"
+                }
+                info = dict(info, episode=episode)
+            outputs.append((obs, rew, done, info))
+            if done:
+                env.reset()
+        return outputs
+
+    nested_env = build_env()
+    compiled_env = CompiledEnv(build_env())
+    rng = np.random.RandomState(cfg.RNG_SEED)
+    actions = [
+        rng.uniform(
+            nested_env.action_space.low, nested_env.action_space.high
+        )
+        for _ in range(min(num_iters, 2000))
+    ]
+    for idx, (output1, output2) in enumerate(
+        zip(_rollout(nested_env, actions), _rollout(compiled_env, actions))
+    ):
+        assert_identical(output1, output2, "step {}".format(idx))
+
+    action = np.zeros(nested_env.action_space.shape)
+    for name, env in [("nested", nested_env), ("compiled", compiled_env)]:
+
+        def _step():
+            _, _, done, _ = env.step(action)
+            if done:
+                env.reset()
+
+        print("{} env.step: {:.2f} us".format(name, timeit(_step, num_iters)))
+
+
+def bench_fidelity(num_iters):
+    """Step throughput vs reward drift (w.r.t. default) of fidelity presets."""
+    rng = np.random.RandomState(cfg.RNG_SEED)
+    actions = None
+    returns = {}
+    for preset in ["default"] + [
+        p for p in FIDELITY_PRESETS.keys() if p != "default"
+    ]:
+        cfg.defrost()
+        cfg.XML.FIDELITY = preset
+        cfg.freeze()
+        env = build_env()
+        if actions is None:
+            actions = [
+                rng.uniform(env.action_space.low, env.action_space.high)
+                for _ in range(num_iters)
+            ]
+
+        # Same open loop actions for all presets
+        ep_return, num_steps = 0.0, 0
+        start = time.perf_counter()
+        for action in actions:
+            _, rew, done, _ = env.step(action)
+            ep_return += rew
+            num_steps += 1
+            if done:
+                break
+        steps_per_sec = num_steps / (time.perf_counter() - start)
+        returns[preset] = ep_return
+        print(
+            "{}: {:.0f} steps/s, return {:.2f}, drift {:.2f}".format(
+                preset, steps_per_sec, ep_return, ep_return - returns["default"]
+            )
+        )
+
+
+def main():
+    # Parse cmd line args
+    args = parse_args()
+
+    # Load config options
+    cfg.merge_from_file(args.cfg_file)
+    cfg.merge_from_list(args.opts)
+    cfg.freeze()
+
+    globals()["bench_{}".format(args.bench)](args.num_iters)
+
+
+if __name__ == "__main__":
+    main()
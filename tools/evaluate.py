@@ -0,0 +1,237 @@
+"""Headless evaluation of trained unimals of a run across the eval tasks.
+
+Example:
+    python tools/evaluate.py --run-dir ./output/ft --num-procs 16 \
+        --seeds 0 1 2 --tasks configs/eval/obstacle.yml configs/eval/incline.yml
+
+Results of each (unimal, task, seed) triple are saved in
+<run-dir>/eval/<task>/results/<id>-<seed>.json, triples with results are
+skipped on re-runs. Per task metric tables are written to
+<run-dir>/eval/<task>.csv.
+"""
+
+import argparse
+import multiprocessing as mp
+import os
+import sys
+from glob import glob
+
+# Torch 1.5 bug, need to import numpy before torch
+# Refer: https://github.com/pytorch/pytorch/issues/37377
+import numpy as np
+import torch
+
+from derl.algos.ppo.envs import make_vec_envs
+from derl.algos.ppo.envs import set_ob_rms
+from derl.algos.ppo.model import Agent
+from derl.algos.ppo.ppo import load_model
+from derl.config import cfg
+from derl.config import get_default_cfg
+from derl.utils import file as fu
+from derl.utils import sample as su
+
+# Defaults, the cfg of every job starts from these
+DEFAULT_CFG = get_default_cfg()
+
+
+def parse_args():
+    """Parses the arguments."""
+    parser = argparse.ArgumentParser(description="Evaluate trained unimals")
+    parser.add_argument("--run-dir", required=True, type=str)
+    parser.add_argument(
+        "--tasks",
+        nargs="+",
+        default=sorted(glob("configs/eval/*.yml")),
+        help="Task config files",
+    )
+    parser.add_argument("--seeds", nargs="+", default=[0], type=int)
+    parser.add_argument("--num-procs", default=mp.cpu_count(), type=int)
+    parser.add_argument("--num-envs", default=4, type=int)
+    parser.add_argument("--num-episodes", default=8, type=int)
+    parser.add_argument(
+        "opts",
+        help="Options applied on top of every task config",
+        default=None,
+        nargs=argparse.REMAINDER,
+    )
+    if len(sys.argv) == 1:
+        parser.print_help()
+        sys.exit(1)
+    return parser.parse_args()
+
+
+def task_name(task_cfg):
+    return fu.path2id(task_cfg)
+
+
+def result_path(run_dir, task, id_, seed):
+    return os.path.join(
+        run_dir, "eval", task, "results", "{}-{}.json".format(id_, seed)
+    )
+
+
+def unimal_cost(run_dir, id_):
+    """Proxy of eval time of unimal, used to schedule longest first."""
+    try:
+        init_state = fu.load_pickle(fu.id2path(id_, "unimal_init", run_dir))
+        return init_state["dof"]
+    except (OSError, KeyError):
+        return 0
+
+
+def get_jobs(run_dir, tasks, seeds):
+    """Pending (unimal, task, seed) triples, longest unimals first."""
+    # Only unimals which finished training have metadata
+    metadata_paths = fu.get_files(os.path.join(run_dir, "metadata"), ".*json$")
+    ids = [
+        fu.path2id(path)
+        for path in metadata_paths
+        if os.path.isfile(fu.id2path(fu.path2id(path), "models", run_dir))
+    ]
+    costs = {id_: unimal_cost(run_dir, id_) for id_ in ids}
+
+    jobs = [
+        (run_dir, id_, task_cfg, seed)
+        for id_ in ids
+        for task_cfg in tasks
+        for seed in seeds
+        if not os.path.isfile(
+            result_path(run_dir, task_name(task_cfg), id_, seed)
+        )
+    ]
+    jobs.sort(key=lambda job: (-costs[job[1]], job[1], job[2], job[3]))
+    return jobs
+
+
+def setup_cfg(run_dir, task_cfg, opts):
+    cfg.defrost()
+    cfg.merge_from_other_cfg(DEFAULT_CFG)
+    # Model and obs settings the unimals of the run were trained with
+    run_cfg = os.path.join(run_dir, DEFAULT_CFG.CFG_DEST)
+    if os.path.isfile(run_cfg):
+        cfg.merge_from_file(run_cfg)
+    cfg.merge_from_file(task_cfg)
+    cfg.merge_from_list(opts)
+    # Pool workers are daemonic and can't have child procs
+    cfg.VECENV.TYPE = "DummyVecEnv"
+    # Env errors are recorded in the eval dir of the task
+    cfg.OUT_DIR = os.path.join(run_dir, "eval", task_name(task_cfg))
+    os.makedirs(fu.get_subfolder("error_metadata"), exist_ok=True)
+    cfg.freeze()
+
+
+def evaluate(xml_path, model_path, seed, num_envs, num_episodes):
+    """Deterministic rollouts, returns episode returns and metrics."""
+    su.set_seed(seed)
+    envs = make_vec_envs(
+        xml_file=xml_path,
+        training=False,
+        norm_rew=False,
+        num_env=num_envs,
+        seed=seed,
+    )
+    actor_critic, ob_rms = load_model(
+        model_path, envs.observation_space, envs.action_space
+    )
+    set_ob_rms(envs, ob_rms)
+    agent = Agent(actor_critic)
+
+    returns, metrics = [], []
+    obs = envs.reset()
+    while len(returns) < num_episodes:
+        _, act, _ = agent.act(obs, deterministic=True)
+        obs, _, _, infos = envs.step(act)
+        for info in infos:
+            if "episode" in info.keys():
+                returns.append(info["episode"]["r"])
+                metrics.append(info.get("metric", np.nan))
+    envs.close()
+    return returns[:num_episodes], metrics[:num_episodes]
+
+
+def eval_job(job):
+    run_dir, id_, task_cfg, seed, opts, num_envs, num_episodes = job
+    torch.set_num_threads(1)
+    task = task_name(task_cfg)
+    result = {"id": id_, "task": task, "seed": seed}
+    try:
+        setup_cfg(run_dir, task_cfg, opts)
+        returns, metrics = evaluate(
+            fu.id2path(id_, "xml", run_dir),
+            fu.id2path(id_, "models", run_dir),
+            seed,
+            num_envs,
+            num_episodes,
+        )
+        result.update({"returns": returns, "metrics": metrics})
+    except (Exception, SystemExit) as e:
+        # Failures are isolated to the job. E.g. obs of the task don't match
+        # the obs the policy was trained on, a missing model or a sim error
+        # (handle_exception exits).
+        result["error"] = "{}: {}".format(type(e).__name__, e)
+
+    path = result_path(run_dir, task, id_, seed)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fu.save_json(result, path)
+    return result
+
+
+def write_metric_tables(run_dir, tasks):
+    """Write <run-dir>/eval/<task>.csv from the results of all triples."""
+    for task_cfg in tasks:
+        task = task_name(task_cfg)
+        results_dir = os.path.join(run_dir, "eval", task, "results")
+        if not os.path.isdir(results_dir):
+            continue
+
+        rows = ["id,seed,mean_return,mean_metric,num_episodes"]
+        for path in fu.get_files(results_dir, ".*json$", sort=True):
+            result = fu.load_json(path)
+            if "error" in result:
+                continue
+            rows.append(
+                "{},{},{:.2f},{:.4f},{}".format(
+                    result["id"],
+                    result["seed"],
+                    np.mean(result["returns"]),
+                    np.nanmean(result["metrics"]),
+                    len(result["returns"]),
+                )
+            )
+        with fu.atomic_open(os.path.join(run_dir, "eval", task + ".csv")) as f:
+            f.write("\n".join(rows) + "\n")
+
+
+def main():
+    # Parse cmd line args
+    args = parse_args()
+    run_dir = os.path.abspath(args.run_dir)
+
+    jobs = [
+        job + (args.opts, args.num_envs, args.num_episodes)
+        for job in get_jobs(run_dir, args.tasks, args.seeds)
+    ]
+    print("Evaluating {} (unimal, task, seed) triples".format(len(jobs)))
+
+    # chunksize 1 keeps the longest first order of dispatch
+    with mp.Pool(args.num_procs) as pool:
+        for idx, result in enumerate(
+            pool.imap_unordered(eval_job, jobs, chunksize=1)
+        ):
+            status = "error" if "error" in result else "done"
+            print(
+                "[{}/{}] {} {} seed {}: {}".format(
+                    idx + 1,
+                    len(jobs),
+                    result["id"],
+                    result["task"],
+                    result["seed"],
+                    status,
+                )
+            )
+
+    write_metric_tables(run_dir, args.tasks)
+
+
+if __name__ == "__main__":
+    main()
@@ -51,6 +51,9 @@ def ppo_train(xml_file, id_, parent_metadata=None):
         torch.backends.cudnn.benchmark = cfg.CUDNN.BENCHMARK
         torch.backends.cudnn.deterministic = cfg.CUDNN.DETERMINISTIC
 
+    # Mark unimal as in-flight, so that training can be resumed on restart
+    fu.save_json({"parent_metadata": parent_metadata}, inflight_path(id_))
+
     # Train unimal
     PPOTrainer = PPO(xml_file=xml_file)
 
@@ -59,13 +62,16 @@ def ppo_train(xml_file, id_, parent_metadata=None):
         # Exit early if population already initialized
         exit_cond = "population_init"
 
-    PPOTrainer.train(exit_cond=exit_cond)
+    PPOTrainer.train(
+        exit_cond=exit_cond, checkpoint_path=fu.id2path(id_, "checkpoints")
+    )
 
     # 种群初始化阶段只训练到初始种群大小即可
     if (
         exit_cond == "population_init" and
         eu.get_population_size() >= cfg.EVO.INIT_POPULATION_SIZE
     ):
+        remove_checkpoint(id_)
         return
     # 搜索空间阶段训练到搜索空间大小即可
 
@@ -73,12 +79,16 @@ def ppo_train(xml_file, id_, parent_metadata=None):
         exit_cond == "search_space" and
         eu.get_searched_space_size() >= cfg.EVO.SEARCH_SPACE_SIZE
     ):
+        remove_checkpoint(id_)
         return
 
     # Save the model
     PPOTrainer.save_model(path=fu.id2path(id_, "models"))
     # Save the rewards
-    PPOTrainer.save_rewards(path=fu.id2path(id_, "rewards"))
+    if cfg.EVO.REWARDS_FORMAT == "columnar":
+        fu.append_reward_history(id_, PPOTrainer.reward_stats())
+    else:
+        PPOTrainer.save_rewards(path=fu.id2path(id_, "rewards"))
 
     if eu.should_save_video():
         PPOTrainer.save_video(os.path.join(cfg.OUT_DIR, "videos"))
@@ -102,18 +112,59 @@ def ppo_train(xml_file, id_, parent_metadata=None):
     else:
         metadata["lineage"] = "{}/{}".format(parent_metadata["lineage"], id_)
 
-    # Save metadata to disk
-    
+    # Save metadata to disk. Metadata is written last, so its existence
+    # implies that all other artifacts of the unimal exist.
     path = os.path.join(fu.get_subfolder("metadata"), "{}.json".format(id_))
     fu.save_json(metadata, path)
+    # Update lineage index used for family queries
+    parent_id = parent_metadata["id"] if parent_metadata else ""
+    eu.record_lineage(id_, parent_id, metadata["lineage"].split("/")[0])
+    remove_checkpoint(id_)
+
+
+def inflight_path(id_):
+    return os.path.join(fu.get_subfolder("checkpoints"), "{}.json".format(id_))
+
+
+def remove_checkpoint(id_):
+    fu.remove_file(fu.id2path(id_, "checkpoints"))
+    fu.remove_file(inflight_path(id_))
+
+
+def resume_inflight(idx):
+    """Finish training of tournament children interrupted by a restart."""
+    inflight_paths = fu.get_files(
+        fu.get_subfolder("checkpoints"),
+        "{}-{}-.*json$".format(cfg.NODE_ID, idx),
+    )
+    for path in inflight_paths:
+        id_ = fu.path2id(path)
+        parent_metadata = fu.load_json(path)["parent_metadata"]
+        # Initial population is resumed by init_population
+        if parent_metadata is None:
+            continue
+
+        if os.path.isfile(fu.id2path(id_, "metadata")) or os.path.isfile(
+            fu.id2path(id_, "error_metadata")
+        ):
+            remove_checkpoint(id_)
+            continue
+
+        if eu.get_searched_space_size() >= cfg.EVO.SEARCH_SPACE_SIZE:
+            return
+
+        print("Resuming {}, proc_id: {}".format(id_, idx))
+        ppo_train(fu.id2path(id_, "xml"), id_, parent_metadata)
 
 
 # 检查unimal是否已经完成初始化训练
 def init_done(unimal_id):
     # 获取unimal的索引 提取进程ID
     unimal_idx = int(unimal_id.split(".")[0].split("-")[1])
-    success_metadata = fu.get_files(fu.get_subfolder("metadata"), ".*json")
-    error_metadata = fu.get_files(fu.get_subfolder("error_metadata"), ".*json")
+    success_metadata = fu.get_files(fu.get_subfolder("metadata"), ".*json$")
+    error_metadata = fu.get_files(
+        fu.get_subfolder("error_metadata"), ".*json$"
+    )
     done_metadata = success_metadata + error_metadata
     # 获取索引
     done_idx = [
@@ -137,7 +188,7 @@ def init_population(proc_id):
     # Divide work by num nodes and then num procs
     # 获取初始种群的XML文件路径
     xml_paths = fu.get_files(
-        fu.get_subfolder("xml"), ".*xml", sort=True, sort_type="time"
+        fu.get_subfolder("xml"), ".*xml$", sort=True, sort_type="time"
     )[: cfg.EVO.INIT_POPULATION_SIZE]
     xml_paths.sort()
     xml_paths = fu.chunkify(xml_paths, cfg.NUM_NODES)[cfg.NODE_ID]
@@ -168,6 +219,7 @@ def tournament_evolution(idx):
     # 每个进程使用不同的随机种子
     # seed = 基础种子 + (节点ID × 每节点进程数 + 进程ID) × 100
     seed = cfg.RNG_SEED + (cfg.NODE_ID * cfg.EVO.NUM_PROCESSES + idx) * 100
+    resume_inflight(idx)
     # 进行进化直到达到搜索空间大小
     while eu.get_searched_space_size() < cfg.EVO.SEARCH_SPACE_SIZE:
         # 使用更强的随机种子确保多进程间的独立性，用到递增种子
@@ -190,7 +242,7 @@ def tournament_evolution(idx):
     # metadata file as master proc uses absence of meta files as sign of completion.
     video_dir = fu.get_subfolder("videos")
     video_meta_files = fu.get_files(
-        video_dir, "{}-{}-.*json".format(cfg.NODE_ID, idx)
+        video_dir, "{}-{}-.*json$".format(cfg.NODE_ID, idx)
     )
     for video_meta_file in video_meta_files:
         fu.remove_file(video_meta_file)
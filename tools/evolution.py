@@ -2,17 +2,16 @@
 
 import argparse
 import os
-import random
 import signal
 import subprocess
 import sys
 import time
+from collections import defaultdict
 from datetime import datetime
+from multiprocessing import Manager
 from multiprocessing import Pool
 from pathlib import Path
 
-import networkx as nx
-
 from derl.config import cfg
 from derl.config import dump_cfg
 from derl.envs.morphology import SymmetricUnimal
@@ -74,6 +73,8 @@ def setup_output_dir():
         "videos",
         "error_metadata",
         "images",
+        "features",
+        "checkpoints",
     ]
     for folder in subfolders:
         os.makedirs(os.path.join(cfg.OUT_DIR, folder), exist_ok=True)
@@ -127,7 +128,62 @@ def limb_count_pop_init(idx, unimal_id):
     # 随机变异直到达到目标肢体数量
     while unimal.num_limbs < num_limbs:
         unimal.mutate()
-    # 保存unimal的xml和初始化数据
+    # Saved by init_unique_unimal only if unique
+    return unimal
+
+
+def _set_init_index(index, count, lock):
+    # Signature index shared by all workers of create_init_unimals. The i-th
+    # signature with n limbs is stored at (n, i) and index[n] is their count,
+    # so entries are never rewritten and can be cached by the workers.
+    global init_index, init_count, init_lock, init_seen
+    init_index, init_count, init_lock = index, count, lock
+    # Signatures of the index already fetched by this worker
+    init_seen = defaultdict(list)
+
+
+def _fetch_signatures(num_limbs, num_signatures):
+    """First num_signatures signatures with num_limbs in the index."""
+    seen = init_seen[num_limbs]
+    seen.extend(
+        init_index[(num_limbs, i)] for i in range(len(seen), num_signatures)
+    )
+    return seen[:num_signatures]
+
+
+def init_unique_unimal(args):
+    """Build an init unimal and save it only if its morphology is new."""
+    idx, unimal_id, dedup = args
+    unimal = globals()[cfg.EVO.INIT_METHOD](idx, unimal_id)
+    signature = simu.geom_orientations_from_etree(unimal.root)
+    # is_same_morphology requires the same num of limbs
+    num_limbs = len(signature)
+
+    def is_dup(others):
+        return any(
+            simu.is_same_morphology(signature, other) for other in others
+        )
+
+    # Compare against a snapshot of the index without holding the lock
+    num_checked = init_index.get(num_limbs, 0)
+    if init_count.value >= cfg.EVO.INIT_POPULATION_SIZE:
+        return None
+    if dedup and is_dup(_fetch_signatures(num_limbs, num_checked)):
+        return None
+
+    with init_lock:
+        if init_count.value >= cfg.EVO.INIT_POPULATION_SIZE:
+            return None
+        # Re-check only the signatures added since the snapshot
+        num_same_size = init_index.get(num_limbs, 0)
+        if dedup and is_dup(
+            _fetch_signatures(num_limbs, num_same_size)[num_checked:]
+        ):
+            return None
+        init_index[(num_limbs, num_same_size)] = signature
+        init_index[num_limbs] = num_same_size + 1
+        init_count.value += 1
+
     unimal.save()
     return unimal_id
 
@@ -142,57 +198,46 @@ def create_init_unimals():
         return
     # 获取初始种群大小（目标种群数量）
     init_pop_size = cfg.EVO.INIT_POPULATION_SIZE
-    # 生成10倍目标种群数量的unimal以确保多样性
-    # Create unimal xmls
-    p = Pool(cfg.EVO.NUM_PROCESSES)
     timestamp = datetime.now().strftime("%d-%H-%M-%S")
-    # 生成unimal_id列表
-    idx_unimal_id = [
-        (idx, "{}-{}-{}".format(cfg.NODE_ID, idx, timestamp))
-        for idx in range(10 * init_pop_size)
-    ]
-    # 并行创建初始种群unimal
-    unimal_ids = p.starmap(globals()[cfg.EVO.INIT_METHOD], idx_unimal_id)
 
-    # 构建相似性图，去除重复unimal
-    G = simu.create_graph_from_uids(
-        None, unimal_ids, "geom_orientation", graph_type="species"
+    def _init_args(start, stop, dedup):
+        return [
+            (idx, "{}-{}-{}".format(cfg.NODE_ID, idx, timestamp), dedup)
+            for idx in range(start, stop)
+        ]
+
+    # Candidates are deduped online against the shared signature index as
+    # they finish and only unique ones are saved. Generation stops as soon as
+    # init_pop_size unique unimals exist.
+    manager = Manager()
+    p = Pool(
+        cfg.EVO.NUM_PROCESSES,
+        initializer=_set_init_index,
+        initargs=(manager.dict(), manager.Value("i", 0), manager.Lock()),
     )
-    # 基于几何方向计算相似性
-    # 获取图的连通分量，每个连通分量代表一类相似的unimal
-    cc = list(nx.connected_components(G))
-
-    # 从每个连通分量中选择一个unimal保留，保第一个，其他的删除
-    unimals_to_remove = []
-    unimals_to_keep = []
-    for same_unimals in cc:
-        if len(same_unimals) == 1:
-            unimals_to_keep.extend(list(same_unimals))
-            continue
-        # 对重复unimal进行排序
-        remove_unimals = sorted(
-            list(same_unimals),
-            key=lambda unimal_id: "-".join(unimal_id.split("-")[:2]),
-        )
-        # 保留第一个unimal
-        unimals_to_keep.append(remove_unimals[0])
-        remove_unimals = remove_unimals[1:]
-        # 删除其他重复unimal
-        unimals_to_remove.extend(remove_unimals)
-    # 调整保留的unimal数量以达到初始种群大小
-    # Number of unimals to add to achieve init_pop_size.
-    padding_count = init_pop_size - len(cc)
+    unimal_ids = []
+    # Try upto 10 times init_pop_size candidates for unique unimals
+    max_candidates = 10 * init_pop_size
+    for unimal_id in p.imap_unordered(
+        init_unique_unimal, _init_args(0, max_candidates, True)
+    ):
+        if unimal_id:
+            unimal_ids.append(unimal_id)
+        if len(unimal_ids) == init_pop_size:
+            break
+
+    # Pad with duplicates if there are not enough unique unimals
+    padding_count = init_pop_size - len(unimal_ids)
     if padding_count > 0:
-        random.shuffle(unimals_to_remove)
-        unimals_to_remove = unimals_to_remove[padding_count:]
-    else:
-        random.shuffle(unimals_to_keep)
-        unimals_to_remove.extend(unimals_to_keep[init_pop_size:])
+        padding_args = _init_args(
+            max_candidates, max_candidates + padding_count, False
+        )
+        for unimal_id in p.imap_unordered(init_unique_unimal, padding_args):
+            unimal_ids.append(unimal_id)
 
-    for unimal in unimals_to_remove:
-        fu.remove_file(fu.id2path(unimal, "xml"))
-        fu.remove_file(fu.id2path(unimal, "unimal_init"))
-        fu.remove_file(fu.id2path(unimal, "images"))
+    p.terminate()
+    p.join()
+    manager.shutdown()
 
     Path(init_setup_done_path).touch()
     print("Finished creating init xmls.")
@@ -241,7 +286,7 @@ def wait_or_kill(subprocs):
 
     if eu.should_save_video():
         video_dir = fu.get_subfolder("videos")
-        reg_str = "{}-.*json".format(cfg.NODE_ID)
+        reg_str = "{}-.*json$".format(cfg.NODE_ID)
         while len(fu.get_files(video_dir, reg_str)) > 0:
             time.sleep(60)
 
@@ -283,6 +328,9 @@ def evolve():
     wait_or_kill(subprocs)
     print("Node ID: {} killed all subprocs!".format(cfg.NODE_ID))
 
+    if cfg.NODE_ID == 0 and cfg.EVO.BLOB_STORE:
+        print("Removed {} unused blobs.".format(fu.gc_blobs()))
+
 
 def main():
     # Parse cmd line args